@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+"""
+Portfolio Benchmarks
+Generates a synthetic photo library and times the build and scan hot paths
+against it, writing results as JSON and comparing them with a saved baseline.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import hashlib
+import argparse
+import platform
+import statistics
+import subprocess
+from pathlib import Path
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Any, Optional, Tuple
+
+import PIL
+from PIL import Image
+
+import build
+import scan_albums
+from records import Photo, Album
+
+SRC_DIR = Path(__file__).resolve().parent
+BENCH_CACHE_DIR = build.CACHE_DIR / "bench"
+DEFAULT_OUTPUT = Path("bench_results.json")
+DEFAULT_THRESHOLD = 0.20
+
+CAMERAS = [
+    ("NIKON Z 8", "NIKKOR Z 24-120mm f/4 S"),
+    ("Pixel 10 Pro XL", "Pixel 10 Pro XL back camera 6.9mm f/1.68"),
+    ("Pixel 6 Pro", "Pixel 6 Pro back camera 6.81mm f/1.85"),
+]
+
+# EXIF tag ids
+ORIENTATION = 0x0112
+MODEL = 0x0110
+EXIF_IFD = 0x8769
+DATE_TIME_ORIGINAL = 0x9003
+EXPOSURE_TIME = 0x829A
+F_NUMBER = 0x829D
+ISO_SPEED = 0x8827
+FOCAL_LENGTH = 0x920A
+LENS_MODEL = 0xA434
+
+def parse_resolutions(value: str) -> List[Tuple[int, int]]:
+    """Parse "6000x4000,4000x3000" into [(6000, 4000), (4000, 3000)]."""
+    resolutions = []
+    for part in value.split(","):
+        width, height = part.lower().split("x")
+        resolutions.append((int(width), int(height)))
+    return resolutions
+
+def make_exif(rng: random.Random, orientation: int, taken: datetime) -> Image.Exif:
+    """Camera-like EXIF block with top-level and EXIF IFD tags."""
+    camera, lens = rng.choice(CAMERAS)
+    exif = Image.Exif()
+    exif[ORIENTATION] = orientation
+    exif[MODEL] = camera
+    ifd = exif.get_ifd(EXIF_IFD)
+    ifd[DATE_TIME_ORIGINAL] = taken.strftime("%Y:%m:%d %H:%M:%S")
+    ifd[EXPOSURE_TIME] = 1 / rng.choice([60, 125, 250, 500, 1000])
+    ifd[F_NUMBER] = rng.choice([1.8, 2.8, 4.0, 5.6, 8.0])
+    ifd[ISO_SPEED] = rng.choice([100, 200, 400, 800, 1600])
+    ifd[FOCAL_LENGTH] = rng.choice([6.9, 24.0, 35.0, 50.0, 85.0])
+    ifd[LENS_MODEL] = lens
+    return exif
+
+def make_photo(
+    path: Path,
+    size: Tuple[int, int],
+    rng: random.Random,
+    exif: Optional[Image.Exif] = None
+):
+    """Write a smooth, photo-like JPEG by upscaling random low-resolution noise."""
+    seed_size = (max(2, size[0] // 64), max(2, size[1] // 64))
+    seed = Image.frombytes("RGB", seed_size, rng.randbytes(seed_size[0] * seed_size[1] * 3))
+    img = seed.resize(size, Image.Resampling.BICUBIC)
+    options = {"quality": 90}
+    if exif is not None:
+        options["exif"] = exif.tobytes()
+    img.save(path, **options)
+
+def generate_library(
+    root: Path,
+    albums: int,
+    photos: int,
+    resolutions: List[Tuple[int, int]],
+    portrait_ratio: float,
+    exif_ratio: float,
+    rotated_ratio: float,
+    seed: int
+) -> int:
+    """
+    Generate a synthetic Albums/ tree under root.
+
+    Args:
+        root: Library root (Albums/ is created inside it)
+        albums: Number of album folders
+        photos: Photos per album
+        resolutions: Stored pixel sizes to pick from
+        portrait_ratio: Fraction of photos that display as portrait
+        exif_ratio: Fraction of photos with camera EXIF
+        rotated_ratio: Fraction of EXIF photos stored rotated with an Orientation tag
+        seed: Random seed; the same parameters always produce the same library
+
+    Returns:
+        Number of photos written
+    """
+    rng = random.Random(seed)
+    start_date = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    count = 0
+    for album_idx in range(albums):
+        album_dir = root / "Albums" / f"Album {album_idx:04d}"
+        album_dir.mkdir(parents=True, exist_ok=True)
+        for photo_idx in range(photos):
+            width, height = rng.choice(resolutions)
+            portrait = rng.random() < portrait_ratio
+            exif = None
+            if rng.random() < exif_ratio:
+                taken = start_date + timedelta(days=album_idx, minutes=photo_idx * 7)
+                if rng.random() < rotated_ratio:
+                    # Stored as landscape pixels; Orientation 6/8 turns it portrait
+                    orientation = rng.choice([6, 8]) if portrait else 3
+                    exif = make_exif(rng, orientation, taken)
+                    portrait = False
+                else:
+                    exif = make_exif(rng, 1, taken)
+            size = (min(width, height), max(width, height)) if portrait else (max(width, height), min(width, height))
+            make_photo(album_dir / f"IMG_{photo_idx:05d}.jpg", size, rng, exif)
+            count += 1
+    return count
+
+def library_dir(params: Dict[str, Any]) -> Path:
+    """Cache directory for a library generated with these parameters."""
+    digest = hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    return BENCH_CACHE_DIR / f"library_{digest}"
+
+def ensure_library(params: Dict[str, Any]) -> Path:
+    """Generate the synthetic library once and reuse it on later runs."""
+    root = library_dir(params).resolve()
+    marker = root / "library.json"
+    if marker.exists():
+        print(f"Reusing synthetic library at {root}")
+        return root
+
+    if root.exists():
+        shutil.rmtree(root)
+    print(f"Generating synthetic library at {root}...")
+    start = time.perf_counter()
+    count = generate_library(
+        root,
+        params["albums"],
+        params["photos"],
+        [tuple(r) for r in params["resolutions"]],
+        params["portrait_ratio"],
+        params["exif_ratio"],
+        params["rotated_ratio"],
+        params["seed"]
+    )
+    # Templates and static assets so a full build can run from the library root
+    shutil.copytree(build.TEMPLATE_DIR, root / build.TEMPLATE_DIR)
+    shutil.copytree(build.STATIC_DIR, root / build.STATIC_DIR)
+    with open(marker, "w") as f:
+        json.dump(params, f, indent=2)
+    print(f"Generated {count} photos in {time.perf_counter() - start:.1f}s")
+    return root
+
+@contextmanager
+def working_directory(path: Path):
+    """Temporarily chdir; build and scan_albums use paths relative to the cwd."""
+    previous = Path.cwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+def time_call(func, repeat: int = 1) -> Dict[str, Any]:
+    """Run func repeat times; report the median and minimum wall time."""
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        runs.append(time.perf_counter() - start)
+    return {
+        "seconds": round(statistics.median(runs), 6),
+        "min_seconds": round(min(runs), 6),
+        "runs": len(runs)
+    }
+
+def reset_outputs(root: Path):
+    """Remove build/scan outputs so each benchmark starts cold."""
+    for path in (root / build.DIST_DIR, root / build.CACHE_DIR, root / "AlbumChanges"):
+        if path.exists():
+            shutil.rmtree(path)
+    metadata = root / scan_albums.OUTPUT_FILE
+    if metadata.exists():
+        metadata.unlink()
+
+def bench_process_image(root: Path, sample: int) -> Dict[str, Any]:
+    """Cold process_image over the first `sample` photos (rendition cache cleared)."""
+    images = sorted((root / "Albums").rglob("*.jpg"))[:sample]
+    reset_outputs(root)
+    with working_directory(root):
+        build.MEDIA_DIR.mkdir(parents=True, exist_ok=True)
+        result = time_call(lambda: [build.process_image(p.relative_to(root)) for p in images])
+    result["items"] = len(images)
+    result["per_item_seconds"] = round(result["seconds"] / max(1, len(images)), 6)
+    return result
+
+def bench_scan_albums(root: Path) -> Dict[str, Dict[str, Any]]:
+    """Cold scan (no metadata) followed by a warm rescan of an unchanged library."""
+    reset_outputs(root)
+    with working_directory(root):
+        cold = time_call(scan_albums.scan_albums)
+        warm = time_call(scan_albums.scan_albums)
+    return {"scan_albums_cold": cold, "scan_albums_warm": warm}
+
+def bench_merge_photo_metadata(count: int, repeat: int) -> Dict[str, Any]:
+    """merge_photo_metadata on a synthetic album with `count` photos, 5% added and removed."""
+    def photo(i: int) -> Photo:
+        return Photo(f"IMG_{i:06d}.jpg", 6000, 4000, metadata={"camera_model": "NIKON Z 8", "iso": 100 + i % 7})
+
+    churn = max(1, count // 20)
+    old_photos = [{**photo(i).to_scan(), "sort_index": i} for i in range(count)]
+
+    def run():
+        new_photos = [photo(i) for i in range(churn, count + churn)]
+        scan_albums.merge_photo_metadata(old_photos, new_photos, scan_albums.ChangeTracker(), "bench")
+
+    result = time_call(run, repeat)
+    result["items"] = count
+    return result
+
+def bench_write_sitemaps(albums: int, photos: int, repeat: int) -> Dict[str, Any]:
+    """write_sitemaps over synthetic album records, into a scratch directory."""
+    def album(a: int) -> Album:
+        album_photos = [
+            Photo(f"{p:06d}.jpg", 1600, 1067, src=f"/media/{a % 256:02x}/{a:04d}{p:06d}_large.jpg")
+            for p in range(photos)
+        ]
+        updated = f"2025-{1 + a % 12:02d}-{1 + a % 28:02d}T12:00:00Z"
+        return Album(f"album-{a:04d}", f"Album {a}", "", "", album_photos[0], updated, {}, album_photos)
+
+    albums_data = [album(a) for a in range(albums)]
+    build_time = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    out_dir = BENCH_CACHE_DIR / "sitemaps"
+    out_dir.mkdir(parents=True, exist_ok=True)
+    result = time_call(lambda: build.write_sitemaps("https://example.com", albums_data, build_time, out_dir), repeat)
+    shutil.rmtree(out_dir)
+    result["items"] = albums * photos
+    return result
+
+def bench_full_build(root: Path, jobs: int) -> Dict[str, Dict[str, Any]]:
+    """End-to-end cold and warm `build.py` runs in a subprocess."""
+    reset_outputs(root)
+    with working_directory(root):
+        scan_albums.scan_albums()
+    command = [sys.executable, str(SRC_DIR / "build.py"), "--jobs", str(jobs), "--reproducible"]
+
+    def run():
+        subprocess.run(command, cwd=root, check=True, stdout=subprocess.DEVNULL)
+
+    cold = time_call(run)
+    warm = time_call(run)
+    return {"full_build_cold": cold, "full_build_warm": warm}
+
+def compare_results(
+    results: Dict[str, Dict[str, Any]],
+    baseline: Dict[str, Dict[str, Any]],
+    threshold: float
+) -> List[str]:
+    """
+    Compare results with a baseline and print a table.
+
+    Returns:
+        Names of benchmarks that got slower by more than threshold
+    """
+    regressions = []
+    print(f"\n{'benchmark':<28} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, result in results.items():
+        if name not in baseline:
+            print(f"{name:<28} {'-':>10} {result['seconds']:>9.3f}s {'new':>8}")
+            continue
+        before = baseline[name]["seconds"]
+        after = result["seconds"]
+        change = (after - before) / before if before > 0 else 0.0
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<28} {before:>9.3f}s {after:>9.3f}s {change:>+7.1%}{flag}")
+    return regressions
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Benchmark the build and scan pipeline on a synthetic library.")
+    parser.add_argument("--albums", type=int, default=3, help="Synthetic albums (default: 3)")
+    parser.add_argument("--photos", type=int, default=10, help="Photos per album (default: 10)")
+    parser.add_argument(
+        "--resolutions",
+        type=parse_resolutions,
+        default=parse_resolutions("4000x3000,6000x4000"),
+        help="Comma-separated stored sizes, e.g. 4000x3000,8256x5504 (default: 4000x3000,6000x4000)"
+    )
+    parser.add_argument("--portrait-ratio", type=float, default=0.3, help="Fraction of portrait photos (default: 0.3)")
+    parser.add_argument("--exif-ratio", type=float, default=0.9, help="Fraction of photos with EXIF (default: 0.9)")
+    parser.add_argument(
+        "--rotated-ratio",
+        type=float,
+        default=0.5,
+        help="Fraction of EXIF photos stored with an Orientation rotation (default: 0.5)"
+    )
+    parser.add_argument("--seed", type=int, default=1, help="Random seed (default: 1)")
+    parser.add_argument("--sample", type=int, default=10, help="Photos timed in the process_image benchmark (default: 10)")
+    parser.add_argument("--repeat", type=int, default=5, help="Repeats for in-memory benchmarks (default: 5)")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1, help="Workers for the full build")
+    parser.add_argument("--skip-build", action="store_true", help="Skip the end-to-end build benchmark")
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT, help=f"Results file (default: {DEFAULT_OUTPUT})")
+    parser.add_argument("--baseline", type=Path, help="Baseline results to compare against")
+    parser.add_argument("--save-baseline", type=Path, help="Also write results to this baseline file")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help=f"Slowdown fraction that counts as a regression (default: {DEFAULT_THRESHOLD})"
+    )
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Benchmark entry point. Returns 1 if any benchmark regressed against the baseline."""
+    args = parse_args(argv)
+    params = {
+        "albums": args.albums,
+        "photos": args.photos,
+        "resolutions": [list(r) for r in args.resolutions],
+        "portrait_ratio": args.portrait_ratio,
+        "exif_ratio": args.exif_ratio,
+        "rotated_ratio": args.rotated_ratio,
+        "seed": args.seed
+    }
+    root = ensure_library(params)
+
+    results = {}
+    print("Benchmarking process_image...")
+    results["process_image"] = bench_process_image(root, args.sample)
+    print("Benchmarking scan_albums...")
+    results.update(bench_scan_albums(root))
+    total_photos = args.albums * args.photos
+    print("Benchmarking merge_photo_metadata...")
+    results["merge_photo_metadata"] = bench_merge_photo_metadata(max(1000, total_photos), args.repeat)
+    print("Benchmarking write_sitemaps...")
+    results["write_sitemaps"] = bench_write_sitemaps(max(100, args.albums), max(100, args.photos), args.repeat)
+    if not args.skip_build:
+        print("Benchmarking full build...")
+        results.update(bench_full_build(root, args.jobs))
+
+    report = {
+        "params": params,
+        "environment": {
+            "python": platform.python_version(),
+            "pillow": PIL.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count()
+        },
+        "results": results
+    }
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {path}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("params") != params:
+            print("Warning: baseline was recorded with different library parameters")
+        regressions = compare_results(results, baseline.get("results", {}), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+            return 1
+    else:
+        for name, result in results.items():
+            print(f"  {name:<28} {result['seconds']:>9.3f}s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
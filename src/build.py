@@ -4,151 +4,1197 @@ Portfolio Site Builder
 Generates static site from content in Albums/ directory.
 """
 
+import io
 import os
+import asyncio
 import sys
 import json
+import base64
+import gzip
 import shutil
+import hashlib
+import time
+import argparse
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from functools import partial
+from xml.sax.saxutils import escape
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple, Callable, Iterator, AsyncIterator
 from datetime import datetime, timezone
 
-from PIL import Image, ExifTags, ImageOps
-from jinja2 import Environment, FileSystemLoader
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+try:
+    import brotli
+except ImportError:  # Optional: .br variants are skipped without it
+    brotli = None
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from PIL import Image, ExifTags, ImageOps, features
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache, meta
+
+import jsonio
+from layout import justified_layout
+from records import Photo, Album
+from search_index import SEARCH_DIR, build_search_index
 
 # Configuration
 ALBUMS_DIR = Path("Albums")
-DIST_DIR = Path("dist")
+# Published site; builds write to STAGING_DIR and swap it in when complete
+PUBLISH_DIR = Path("dist")
+STAGING_DIR = Path("dist.staging")
+PREVIOUS_DIR = Path("dist.previous")
+# Completed image/page units of the build in STAGING_DIR, for --resume
+JOURNAL_FILE_NAME = ".build-journal.jsonl"
+# Output tree of the current build (see set_output_dir)
+DIST_DIR = PUBLISH_DIR
 MEDIA_DIR = DIST_DIR / "media"
+DB_SHARD_DIR = DIST_DIR / "db"
 TEMPLATE_DIR = Path("src/templates")
 STATIC_DIR = Path("src/static")
+# Builder code whose changes can alter any output (see builder_fingerprint)
+BUILDER_MODULES = ("build.py", "records.py", "layout.py", "search_index.py", "jsonio.py")
+VALID_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".JPG", ".JPEG"}
 
 # Base URL configuration
 BASE_URL = os.getenv("SITE_BASE_URL", "")
 
 LARGE_SIZE = (1600, 1200)
 THUMB_SIZE = (600, 600)
+LARGE_QUALITY = 85
+THUMB_QUALITY = 80
+# Decode JPEGs at no less than this multiple of the large rendition size
+DRAFT_REDUCING_GAP = 2.0
+# Image memory admitted at once across workers when --memory-budget is not
+# given, as a fraction of physical RAM (fallback when RAM size is unknown)
+MEMORY_BUDGET_FRACTION = 0.5
+DEFAULT_MEMORY_BUDGET_MB = 2048
+# Image pipeline: threads reading sources and writing renditions, and items
+# buffered between stages per consumer (bounds memory when a stage falls behind)
+PIPELINE_IO_WORKERS = 4
+PIPELINE_QUEUE_DEPTH = 2
+# Long side of the inline preview shown while a photo loads
+PLACEHOLDER_SIZE = 16
+
+# Responsive rendition profile: extra widths (capped at the large rendition's
+# width) encoded in modern formats for <picture>/srcset. The large JPEG stays
+# as the universal fallback and lightbox source.
+RENDITION_WIDTHS = (400, 800, 1200, 1600)
+RENDITION_FORMATS = {
+    # format: (file extension, MIME type, save options)
+    "avif": ("avif", "image/avif", {"quality": 60, "speed": 8}),
+    "webp": ("webp", "image/webp", {"quality": 80, "method": 4}),
+}
+
+# Justified photo grid, precomputed per reference content width. The CSS picks
+# the profile by viewport (see .justified-grid in style.css); phones get one column.
+LAYOUT_PROFILES = {
+    # name: reference content width, target row height, gap (px)
+    "wide": {"width": 880, "row_height": 300, "gap": 15},
+    "medium": {"width": 600, "row_height": 240, "gap": 15},
+}
+
+# Persistent rendition cache (survives across builds, lives outside dist/)
+CACHE_DIR = Path(".cache")
+RENDITION_CACHE_DIR = CACHE_DIR / "renditions"
+# Bump when process_image output changes in a way the settings below don't capture
+RENDITION_CACHE_VERSION = 5
+# Input fingerprints of generated pages from the previous build
+PAGE_STATE_FILE = CACHE_DIR / "pages.json"
+# Compiled Jinja templates, reused across builds
+TEMPLATE_CACHE_DIR = CACHE_DIR / "jinja"
+
+# Static assets are published as name.<hash>.ext (plus the plain name) and
+# referenced from templates through asset(); see setup_directories
+ASSET_HASH_LENGTH = 10
+ASSET_MANIFEST_FILE = "manifest.json"
+# Text outputs that get .gz/.br siblings for hosts that serve precompressed files
+COMPRESS_EXTENSIONS = {".html", ".css", ".js", ".json", ".xml", ".txt", ".svg"}
+
+# Sitemap protocol limits per file, and Google's image:image limit per <url>
+SITEMAP_MAX_URLS = 50000
+SITEMAP_MAX_BYTES = 50 * 1024 * 1024
+SITEMAP_MAX_IMAGES = 1000
 
-def setup_directories():
-    """Ensure output directories exist."""
+# Content hashes of every published file, and the delta from the previous build
+DIST_MANIFEST_FILE = CACHE_DIR / "dist_manifest.json"
+DIST_CHANGES_FILE = CACHE_DIR / "dist_changes.json"
+
+# Written to the output root with --profile
+BUILD_REPORT_NAME = "build_report.json"
+# Per-image timings collected by process_image and the pipeline
+IMAGE_STAGES = ("read", "decode", "resize", "encode", "write")
+
+def setup_directories() -> Dict[str, str]:
+    """
+    Ensure output directories exist and publish static assets.
+    
+    Each asset is copied under its plain name and a content-hashed name
+    (style.css -> style.<hash>.css); the hashed names can be cached forever.
+    Only assets whose content changed are copied, so unchanged ones keep
+    their mtime and their precompressed variants stay current.
+    
+    Returns:
+        Asset manifest: plain path -> hashed path, both relative to static/
+    """
     print("Setting up directories...")
     MEDIA_DIR.mkdir(parents=True, exist_ok=True)
     
     # Copy static assets if they exist
+    manifest = {}
     if STATIC_DIR.exists():
         dist_static = DIST_DIR / "static"
-        if dist_static.exists():
-            shutil.rmtree(dist_static)
-        shutil.copytree(STATIC_DIR, dist_static)
-
-def get_exif_data(img: Image.Image) -> Dict[str, str]:
-    """Extract and format specific EXIF data."""
-    meta = {}
-    exif = img.getexif()
-    if not exif:
-        return meta
+        published = {ASSET_MANIFEST_FILE}
+        for src in sorted(p for p in STATIC_DIR.rglob("*") if p.is_file()):
+            rel_path = src.relative_to(STATIC_DIR)
+            digest = hash_file(src)
+            hashed = rel_path.with_name(f"{rel_path.stem}.{digest[:ASSET_HASH_LENGTH]}{rel_path.suffix}")
+            for target in (rel_path, hashed):
+                published.add(target.as_posix())
+                dest = dist_static / target
+                if dest.is_file() and hash_file(dest) == digest:
+                    continue
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                prepare_output(dest)
+                shutil.copy2(src, dest)
+            manifest[rel_path.as_posix()] = hashed.as_posix()
+        
+        # Drop removed assets, old hashed names and their variants
+        for path in sorted(p for p in dist_static.rglob("*") if p.is_file()):
+            rel_path = path.relative_to(dist_static).as_posix()
+            if rel_path.endswith((".gz", ".br")):
+                rel_path = rel_path[:-3]
+            if rel_path not in published:
+                path.unlink()
         
-    for key, val in exif.items():
-        if key in ExifTags.TAGS:
-            tag = ExifTags.TAGS[key]
-            if tag == "DateTime" or tag == "DateTimeOriginal":
-                meta["date_taken"] = str(val)
-            elif tag == "ExposureTime":
-                # Convert fraction if needed, simplistically for now
-                meta["shutter"] = str(val)
-            elif tag == "FNumber":
-                meta["aperture"] = f"f/{float(val):.1f}"
-            elif tag == "ISOSpeedRatings":
-                meta["iso"] = str(val)
-    return meta
-
-def process_image(img_path: Path, album_slug: str) -> Optional[Dict[str, Any]]:
-    """Process a single image."""
+        manifest_path = dist_static / ASSET_MANIFEST_FILE
+        try:
+            unchanged = jsonio.load(manifest_path) == manifest
+        except (OSError, jsonio.JSONDecodeError):
+            unchanged = False
+        if not unchanged:
+            jsonio.dump(manifest, manifest_path, indent=True, sort_keys=True)
+    return manifest
+
+def asset_url(manifest: Dict[str, str], name: str) -> str:
+    """Site-relative URL of a static asset, fingerprinted when it is in the manifest."""
+    return f"/static/{manifest.get(name, name)}"
+
+def compressors() -> List[Tuple[str, Callable[[bytes], bytes]]]:
+    """(suffix, compress) for each precompressed variant; gzip output omits its timestamp."""
+    variants = [(".gz", partial(gzip.compress, compresslevel=9, mtime=0))]
+    if brotli:
+        variants.append((".br", partial(brotli.compress, quality=11)))
+    return variants
+
+def compress_file(path: Path) -> int:
+    """
+    Write .gz (and .br) siblings of path unless they are already current.
+    
+    Variants carry the source's mtime, so an untouched output is not recompressed.
+    
+    Returns:
+        Number of variants written
+    """
+    source_stat = path.stat()
+    data = None
+    written = 0
+    for suffix, compress in compressors():
+        target = path.with_name(path.name + suffix)
+        try:
+            if target.stat().st_mtime_ns == source_stat.st_mtime_ns:
+                continue
+        except FileNotFoundError:
+            pass
+        if data is None:
+            data = path.read_bytes()
+        tmp_path = target.with_name(target.name + ".tmp")
+        tmp_path.write_bytes(compress(data))
+        os.utime(tmp_path, ns=(source_stat.st_atime_ns, source_stat.st_mtime_ns))
+        os.replace(tmp_path, target)
+        written += 1
+    return written
+
+def live_outputs(albums_data: list, page_keys: List[str]) -> set:
+    """
+    Paths (relative to DIST_DIR) this build is responsible for, besides
+    static/, the sitemap shards and precompressed variants.
+    
+    Args:
+        albums_data: Albums; every rendition their photos reference is live
+        page_keys: OutputCache keys of pages written or skipped this build
+    """
+    live = set(page_keys) | {"db.json"}
+    for album in albums_data:
+        live.add(f"db/{album.slug}.json")
+        for photo in album.photos:
+            live.add(photo.src.lstrip("/"))
+            live.add(photo.thumb.lstrip("/"))
+            for source in photo.sources:
+                live.update(v["src"].lstrip("/") for v in source["variants"])
+    return live
+
+def prune_outputs(root: Path, live: set) -> List[str]:
+    """
+    Delete files under root that no longer belong to the site: renditions of
+    removed photos, pages and shards of removed albums, and the per-album
+    media folders of older builds. Empty directories are removed too.
+    
+    Args:
+        root: Output tree
+        live: Paths from live_outputs
+        
+    Returns:
+        Removed paths, relative to root
+    """
+    removed = []
+    for dirpath, _, filenames in os.walk(root, topdown=False):
+        directory = Path(dirpath)
+        for name in filenames:
+            rel_path = (directory / name).relative_to(root).as_posix()
+            base = rel_path
+            if name.endswith((".gz", ".br")) and Path(name[:-3]).suffix in COMPRESS_EXTENSIONS:
+                base = rel_path[:-3]
+            if (
+                base in live
+                or base.startswith("static/")
+                or (directory == root and name.startswith("sitemap") and ".xml" in name)
+                or name == JOURNAL_FILE_NAME
+            ):
+                continue
+            (directory / name).unlink()
+            removed.append(rel_path)
+        if directory != root and not any(directory.iterdir()):
+            directory.rmdir()
+    return sorted(removed)
+
+def build_manifest(root: Path, previous: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    SHA-256, size and mtime of every file under root.
+    
+    Files whose size and mtime match the previous manifest reuse its hash;
+    unchanged outputs are left untouched by the build, so only new or
+    rewritten files are read.
+    
+    Returns:
+        Relative path -> {"sha256", "size", "mtime_ns"}
+    """
+    manifest = {}
+    for path in sorted(p for p in root.rglob("*") if p.is_file() and p.name != JOURNAL_FILE_NAME):
+        rel_path = path.relative_to(root).as_posix()
+        stat = path.stat()
+        old = previous.get(rel_path, {})
+        if old.get("size") == stat.st_size and old.get("mtime_ns") == stat.st_mtime_ns:
+            digest = old["sha256"]
+        else:
+            digest = hash_file(path)
+        manifest[rel_path] = {"sha256": digest, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    return manifest
+
+def diff_manifests(old: Dict[str, Dict[str, Any]], new: Dict[str, Dict[str, Any]]) -> Dict[str, List[str]]:
+    """Added, changed (different content) and removed paths between two manifests."""
+    return {
+        "added": sorted(set(new) - set(old)),
+        "changed": sorted(p for p in set(new) & set(old) if new[p]["sha256"] != old[p]["sha256"]),
+        "removed": sorted(set(old) - set(new))
+    }
+
+def load_manifest(path: Path = DIST_MANIFEST_FILE) -> Dict[str, Dict[str, Any]]:
+    """Previous build's manifest, or {} (every file then counts as added)."""
     try:
-        filename = img_path.name
-        slug_dir = MEDIA_DIR / album_slug
-        slug_dir.mkdir(exist_ok=True)
+        return jsonio.load(path)
+    except (OSError, jsonio.JSONDecodeError):
+        return {}
+
+def precompress_outputs(root: Path, workers: int = 1) -> Tuple[int, int]:
+    """
+    Precompress every text output under root in parallel and drop variants
+    whose source is gone.
+    
+    Args:
+        root: Output tree
+        workers: Number of threads (zlib and brotli release the GIL)
         
-        large_filename = f"large_{filename}"
-        thumb_filename = f"thumb_{filename}"
+    Returns:
+        (text files seen, variants written)
+    """
+    suffixes = [suffix for suffix, _ in compressors()]
+    for suffix in (".gz", ".br"):
+        for variant in root.rglob(f"*{suffix}"):
+            source = variant.with_suffix("")
+            if source.suffix in COMPRESS_EXTENSIONS and (suffix not in suffixes or not source.exists()):
+                variant.unlink()
+    
+    paths = [p for p in root.rglob("*") if p.suffix in COMPRESS_EXTENSIONS and p.is_file()]
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        written = sum(pool.map(compress_file, paths))
+    return len(paths), written
+
+def set_output_dir(root: Path):
+    """Point DIST_DIR and the paths derived from it at another output tree."""
+    global DIST_DIR, MEDIA_DIR, DB_SHARD_DIR
+    DIST_DIR = root
+    MEDIA_DIR = root / "media"
+    DB_SHARD_DIR = root / "db"
+
+def prepare_output(path: Path):
+    """
+    Remove path before it is rewritten.
+    
+    The staging tree starts as hardlinks to the published files, so writing
+    in place would also change the live copy in PUBLISH_DIR.
+    """
+    path.unlink(missing_ok=True)
+
+class BuildJournal:
+    """
+    Append-only log of completed image and page units in the staging tree.
+    
+    Each line is flushed as soon as its unit is finished, so a killed build
+    leaves a journal that --resume can trust.
+    """
+    
+    def __init__(self, path: Path, resume: bool = False):
+        self.path = path
+        self.images = {}  # rendition key -> process_image record
+        self.pages = {}  # output key -> input fingerprint
+        if resume:
+            self._load()
+        self._lock = threading.Lock()
+        self._file = open(path, "a" if resume else "w", encoding="utf-8")
+    
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = jsonio.loads(line)
+                    except jsonio.JSONDecodeError:
+                        continue  # Torn final line from a killed build
+                    if entry.get("kind") == "image":
+                        self.images[entry["key"]] = entry["record"]
+                    elif entry.get("kind") == "page":
+                        self.pages[entry["key"]] = entry["fingerprint"]
+        except OSError:
+            pass
+    
+    def _append(self, entry: Dict[str, Any]):
+        line = jsonio.dumps(entry).decode("utf-8") + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+    
+    def record_image(self, key: str, record: Dict[str, Any]):
+        """Mark an image's renditions as written to the staging tree."""
+        self._append({"kind": "image", "key": key, "record": record})
+    
+    def record_page(self, key: str, fingerprint: str):
+        """Mark an output file as written with the given input fingerprint."""
+        self._append({"kind": "page", "key": key, "fingerprint": fingerprint})
+    
+    def finish(self):
+        """Close and delete the journal; a staging tree without one is complete."""
+        self._file.close()
+        self.path.unlink(missing_ok=True)
+
+def seed_staging():
+    """Fill STAGING_DIR with hardlinks to the published files (copies where links fail)."""
+    if not PUBLISH_DIR.exists():
+        return
+    for dirpath, _, filenames in os.walk(PUBLISH_DIR):
+        target_dir = STAGING_DIR / Path(dirpath).relative_to(PUBLISH_DIR)
+        target_dir.mkdir(parents=True, exist_ok=True)
+        for name in filenames:
+            try:
+                os.link(Path(dirpath) / name, target_dir / name)
+            except OSError:
+                shutil.copy2(Path(dirpath) / name, target_dir / name)
+
+def prepare_staging(resume: bool = False) -> BuildJournal:
+    """
+    Create (or reopen, with resume) the staging tree and its journal.
+    
+    Args:
+        resume: Continue an interrupted build in STAGING_DIR instead of starting over
         
-        large_path = slug_dir / large_filename
-        thumb_path = slug_dir / thumb_filename
+    Returns:
+        The journal for this build
+    """
+    journal_file = STAGING_DIR / JOURNAL_FILE_NAME
+    if resume and journal_file.exists():
+        journal = BuildJournal(journal_file, resume=True)
+        print(f"Resuming build in {STAGING_DIR}: {len(journal.images)} images and {len(journal.pages)} outputs already done.")
+        return journal
+    
+    if STAGING_DIR.exists():
+        if not resume:
+            print(f"Discarding incomplete build in {STAGING_DIR} (use --resume to continue it).")
+        shutil.rmtree(STAGING_DIR)
+    STAGING_DIR.mkdir(parents=True)
+    # Journal first: a staging tree without one is treated as complete
+    journal = BuildJournal(journal_file)
+    seed_staging()
+    return journal
+
+def publish_staging():
+    """Swap the finished staging tree into PUBLISH_DIR."""
+    if PREVIOUS_DIR.exists():
+        shutil.rmtree(PREVIOUS_DIR)
+    if PUBLISH_DIR.exists():
+        os.replace(PUBLISH_DIR, PREVIOUS_DIR)
+    os.replace(STAGING_DIR, PUBLISH_DIR)
+    shutil.rmtree(PREVIOUS_DIR, ignore_errors=True)
+
+def recover_interrupted_publish():
+    """Finish a publish that was cut off between its renames, or roll it back."""
+    if STAGING_DIR.exists() and not (STAGING_DIR / JOURNAL_FILE_NAME).exists():
+        print(f"Publishing completed build left in {STAGING_DIR}...")
+        publish_staging()
+    elif not PUBLISH_DIR.exists() and PREVIOUS_DIR.exists():
+        print(f"Restoring {PUBLISH_DIR} from {PREVIOUS_DIR}...")
+        os.replace(PREVIOUS_DIR, PUBLISH_DIR)
+    else:
+        return
+    # Page fingerprints may describe a different tree; rewrite every page once
+    PAGE_STATE_FILE.unlink(missing_ok=True)
+
+def hash_file(path: Path, chunk_size: int = 1 << 20) -> str:
+    """Return the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def builder_fingerprint() -> str:
+    """
+    Combined hash of the builder's modules and templates.
+    
+    Records, layout and the search index feed values into outputs that their
+    recorded inputs don't capture, so a change to any of them rebuilds everything.
+    """
+    digest = hashlib.sha256()
+    module_dir = Path(__file__).parent
+    sources = [module_dir / name for name in BUILDER_MODULES]
+    if TEMPLATE_DIR.is_dir():
+        sources += sorted(p for p in TEMPLATE_DIR.rglob("*") if p.is_file())
+    for path in sources:
+        digest.update(path.name.encode("utf-8"))
+        digest.update(hash_file(path).encode("utf-8"))
+    return digest.hexdigest()
+
+def rendition_settings() -> Dict[str, Any]:
+    """Settings that affect rendition output; any change invalidates the cache."""
+    return {
+        "version": RENDITION_CACHE_VERSION,
+        "large_size": list(LARGE_SIZE),
+        "thumb_size": list(THUMB_SIZE),
+        "large_quality": LARGE_QUALITY,
+        "thumb_quality": THUMB_QUALITY,
+        "draft_reducing_gap": DRAFT_REDUCING_GAP,
+        "widths": list(RENDITION_WIDTHS),
+        "formats": {name: [ext, options] for name, (ext, _, options) in enabled_formats().items()},
+    }
+
+def enabled_formats() -> Dict[str, Tuple[str, str, Dict[str, Any]]]:
+    """RENDITION_FORMATS entries this Pillow build can encode, in preference order."""
+    return {name: spec for name, spec in RENDITION_FORMATS.items() if features.check(name)}
+
+def rendition_cache_key(img_path: Path) -> str:
+    """Build a cache key from source content hash plus rendition settings."""
+    settings = json.dumps(rendition_settings(), sort_keys=True)
+    settings_hash = hashlib.sha256(settings.encode("utf-8")).hexdigest()
+    return hashlib.sha256(f"{hash_file(img_path)}:{settings_hash}".encode("utf-8")).hexdigest()
+
+def _cache_entry_dir(key: str) -> Path:
+    return RENDITION_CACHE_DIR / key[:2] / key
+
+def _restore_cached_file(src: Path, dest: Path):
+    """Copy a cached file to dest unless an identically sized copy is already there."""
+    if dest.exists() and dest.stat().st_size == src.stat().st_size:
+        return
+    prepare_output(dest)
+    shutil.copyfile(src, dest)
+
+def load_cached_rendition(key: str) -> Optional[Dict[str, Any]]:
+    """
+    Restore renditions from the cache into MEDIA_DIR.
+    
+    Args:
+        key: Cache key from rendition_cache_key
+        
+    Returns:
+        Cached record (w, h, files, variants) or None on a miss
+    """
+    entry_dir = _cache_entry_dir(key)
+    record_file = entry_dir / "record.json"
+    if not record_file.exists():
+        return None
+    
+    try:
+        record = jsonio.load(record_file)
+        for rel_path in record["files"]:
+            dest = MEDIA_DIR / rel_path
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            _restore_cached_file(entry_dir / Path(rel_path).name, dest)
+    except (OSError, KeyError, jsonio.JSONDecodeError) as e:
+        print(f"Warning: ignoring damaged cache entry {key}: {e}")
+        return None
+    
+    return record
+
+def store_cached_rendition(key: str, record: Dict[str, Any], outputs: List[Tuple[str, bytes]]):
+    """Save freshly encoded renditions ((path relative to MEDIA_DIR, bytes) pairs) into the cache."""
+    entry_dir = _cache_entry_dir(key)
+    try:
+        entry_dir.mkdir(parents=True, exist_ok=True)
+        for rel_path, data in outputs:
+            (entry_dir / Path(rel_path).name).write_bytes(data)
+        # Write the record last so a partial entry is never treated as a hit
+        jsonio.dump(record, entry_dir / "record.json")
+    except OSError as e:
+        print(f"Warning: could not cache renditions for {key}: {e}")
+
+def update_cached_record(key: str, record: Dict[str, Any]):
+    """Rewrite a cache entry's record.json after adding fields to it."""
+    try:
+        jsonio.dump(record, _cache_entry_dir(key) / "record.json")
+    except OSError as e:
+        print(f"Warning: could not update cache record for {key}: {e}")
+
+def prune_rendition_cache(live_keys: set) -> int:
+    """
+    Delete cache entries whose source is no longer part of the site.
+    
+    Args:
+        live_keys: Rendition cache keys of every source in this build
         
+    Returns:
+        Number of entries removed
+    """
+    if not RENDITION_CACHE_DIR.is_dir():
+        return 0
+    removed = 0
+    for shard in RENDITION_CACHE_DIR.iterdir():
+        if not shard.is_dir():
+            continue
+        for entry_dir in shard.iterdir():
+            if entry_dir.name not in live_keys:
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                removed += 1
+        if not any(shard.iterdir()):
+            shard.rmdir()
+    return removed
+
+def configure_draft(img: Image.Image, target_size: Tuple[int, int]):
+    """
+    Ask the JPEG decoder to scale down while decoding.
+    
+    The draft keeps at least DRAFT_REDUCING_GAP times the final pixel count per
+    side, matching Image.thumbnail's own two-step quality margin. Sizes are
+    computed in stored (pre-rotation) orientation. Non-JPEG images ignore draft.
+    
+    Args:
+        img: Freshly opened, not yet loaded image
+        target_size: Bounding box of the largest rendition, in display orientation
+    """
+    orientation = img.getexif().get(ExifTags.Base.Orientation, 1)
+    box_w, box_h = target_size
+    if orientation in (5, 6, 7, 8):
+        box_w, box_h = box_h, box_w
+    
+    width, height = img.size
+    fit = min(box_w / width, box_h / height, 1.0)
+    img.draft(None, (
+        max(1, int(width * fit * DRAFT_REDUCING_GAP)),
+        max(1, int(height * fit * DRAFT_REDUCING_GAP))
+    ))
+
+def reduce_factor(size: Tuple[int, int], target_size: Tuple[int, int]) -> int:
+    """
+    Largest integer Image.reduce factor that still leaves DRAFT_REDUCING_GAP
+    times the fitted rendition size per side (1 = no reduction).
+    
+    The factor follows the thumbnail fit, which is set by whichever side is
+    furthest over the box, so panoramas reduce as far as their rendition
+    allows. Orientation-agnostic: the box is matched to the image's own long side.
+    """
+    width, height = size
+    box_long, box_short = max(target_size), min(target_size)
+    if width >= height:
+        box_w, box_h = box_long, box_short
+    else:
+        box_w, box_h = box_short, box_long
+    return max(1, int(max(width / box_w, height / box_h) / DRAFT_REDUCING_GAP))
+
+def estimate_image_memory(img_path: Path) -> int:
+    """
+    Estimate process_image's peak memory for a source from its header alone.
+    
+    Applies the same JPEG draft as process_image to get the decoded size, then
+    counts the source file (held in memory while it is decoded), the decoded
+    buffer plus the reduced copy that replaces it (or the transposed copy, when
+    there is nothing to reduce) and the large rendition.
+    
+    Returns:
+        Estimated bytes (0 if the header can't be read)
+    """
+    try:
+        file_size = img_path.stat().st_size
         with Image.open(img_path) as img:
-            # Handle orientation if needed (Exif transpose)
-            img = ImageOps.exif_transpose(img)
-            
-            # Extract Meta
-            meta = get_exif_data(img)
-            
-            # Save Large
-            img_large = img.copy()
-            img_large.thumbnail(LARGE_SIZE)
-            img_large.save(large_path, quality=85)
-            
-            # Save Thumb
-            img_thumb = img.copy()
-            img_thumb.thumbnail(THUMB_SIZE)
-            img_thumb.save(thumb_path, quality=80)
+            configure_draft(img, LARGE_SIZE)
+            size, mode = img.size, img.mode
+    except Exception:
+        return 0
+    # Pillow stores multi-band pixels in 4 bytes, 1-bit/L/P in 1
+    pixel_bytes = 1 if mode in ("1", "L", "P") else 2 if mode.startswith("I;16") else 4
+    decoded = size[0] * size[1] * pixel_bytes
+    factor = reduce_factor(size, LARGE_SIZE)
+    working = decoded // (factor * factor)
+    return file_size + decoded + working + LARGE_SIZE[0] * LARGE_SIZE[1] * 4
+
+def default_memory_budget() -> int:
+    """MEMORY_BUDGET_FRACTION of physical RAM in bytes, or DEFAULT_MEMORY_BUDGET_MB if unknown."""
+    try:
+        total = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+        return int(total * MEMORY_BUDGET_FRACTION)
+    except (AttributeError, ValueError, OSError):
+        return DEFAULT_MEMORY_BUDGET_MB * 1024 * 1024
+
+def media_filenames(key: str, suffix: str) -> Tuple[str, str]:
+    """Content-addressed paths (relative to MEDIA_DIR) for the large and thumb renditions."""
+    suffix = suffix.lower()
+    return f"{key[:2]}/{key}_large{suffix}", f"{key[:2]}/{key}_thumb{suffix}"
+
+def source_key(img_path: Path) -> Optional[str]:
+    """Rendition cache key for an image, or None if it can't be read."""
+    try:
+        return rendition_cache_key(img_path)
+    except OSError as e:
+        print(f"Error reading {img_path}: {e}")
+        return None
+
+def build_sources(variants: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Group encoded variants into <picture> sources, preferred format first.
+    
+    Returns:
+        List of {"type": MIME type, "variants": [{"src", "w"}, ...]} ordered by width
+    """
+    sources = []
+    for name, (_, mime_type, _) in enabled_formats().items():
+        entries = sorted(
+            ({"src": f"/media/{v['file']}", "w": v["w"]} for v in variants if v["format"] == name),
+            key=lambda v: v["w"]
+        )
+        if entries:
+            sources.append({"type": mime_type, "variants": entries})
+    return sources
+
+def make_placeholder(img: Image.Image) -> Dict[str, str]:
+    """
+    Tiny inline preview and dominant color, shown in place of a photo while it loads.
+    
+    Args:
+        img: Any rendition of the photo (the thumbnail is plenty)
+        
+    Returns:
+        {"placeholder": data URI of a PLACEHOLDER_SIZE preview, "color": "#rrggbb"}
+    """
+    small = img.convert("RGB")
+    small.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), Image.Resampling.BOX)
+    
+    buffer = io.BytesIO()
+    if features.check("webp"):
+        small.save(buffer, format="WEBP", quality=50)
+        mime_type = "image/webp"
+    else:
+        small.save(buffer, format="PNG", optimize=True)
+        mime_type = "image/png"
+    
+    # Most common of a few quantized colors, rather than a muddy average
+    palette = small.quantize(colors=4)
+    _, index = max(palette.getcolors())
+    r, g, b = palette.getpalette()[index * 3:index * 3 + 3]
+    return {
+        "placeholder": f"data:{mime_type};base64,{base64.b64encode(buffer.getvalue()).decode('ascii')}",
+        "color": f"#{r:02x}{g:02x}{b:02x}"
+    }
+
+class ImageTimer:
+    """Accumulates decode/resize/encode seconds for one image."""
+    
+    def __init__(self):
+        self.times = {"decode": 0.0, "resize": 0.0, "encode": 0.0}
+        self._last = time.perf_counter()
+    
+    def lap(self, kind: str):
+        """Charge the time since the previous lap to kind."""
+        now = time.perf_counter()
+        self.times[kind] = self.times.get(kind, 0.0) + now - self._last
+        self._last = now
+
+def encode_image(img: Image.Image, image_format: str, **options) -> bytes:
+    """Encode an image in memory."""
+    buffer = io.BytesIO()
+    img.save(buffer, format=image_format, **options)
+    return buffer.getvalue()
+
+def encode_variants(
+    img: Image.Image,
+    key: str,
+    timer: Optional[ImageTimer] = None
+) -> Tuple[List[Dict[str, Any]], List[Tuple[str, bytes]]]:
+    """
+    Encode responsive variants of the large rendition.
+    
+    Args:
+        img: Loaded large rendition
+        key: Rendition key used to name the files
+        timer: Optional ImageTimer charged with resize/encode time
+    
+    Returns:
+        ({"format", "w", "file"} per variant, [(file, encoded bytes)]) with file relative to MEDIA_DIR
+    """
+    width, height = img.size
+    widths = sorted({w for w in RENDITION_WIDTHS if w < width} | {width}, reverse=True)
+    
+    timer = timer or ImageTimer()
+    variants = []
+    outputs = []
+    for target_width in widths:
+        if target_width == width:
+            resized = img
+        else:
+            resized = img.resize((target_width, max(1, round(height * target_width / width))), Image.Resampling.LANCZOS)
+        timer.lap("resize")
+        for name, (ext, _, options) in enabled_formats().items():
+            rel_path = f"{key[:2]}/{key}_{target_width}.{ext}"
+            outputs.append((rel_path, encode_image(resized, name.upper(), **options)))
+            variants.append({"format": name, "w": target_width, "file": rel_path})
+            timer.lap("encode")
+    return variants, outputs
+
+def encode_renditions(
+    data: bytes,
+    key: str,
+    suffix: str
+) -> Tuple[Dict[str, Any], List[Tuple[str, bytes]], Dict[str, float]]:
+    """
+    Decode a source image and encode all of its renditions in memory.
+    
+    This is the CPU stage of image processing. It touches no files, so it can
+    run in a worker process while the main process reads and writes.
+    
+    Args:
+        data: Source file contents
+        key: Rendition cache key, used to name the outputs
+        suffix: Source file suffix; the large and thumb renditions keep its format
+    
+    Returns:
+        (cache record, [(path relative to MEDIA_DIR, bytes)], decode/resize/encode seconds)
+    """
+    timer = ImageTimer()
+    large_filename, thumb_filename = media_filenames(key, suffix)
+    image_format = Image.registered_extensions()[suffix.lower()]
+    with Image.open(io.BytesIO(data)) as img:
+        # Decode JPEGs straight at a reduced DCT scale instead of full resolution
+        configure_draft(img, LARGE_SIZE)
+        img.load()
+        timer.lap("decode")
+        
+        # Shrink oversized (non-draftable or still huge) sources right away,
+        # so the full-size buffer is freed before any other copy is made
+        factor = reduce_factor(img.size, LARGE_SIZE)
+        if factor > 1:
+            exif = img.getexif()
+            img = img.reduce(factor)
+            img.info["exif"] = exif.tobytes()
+            timer.lap("resize")
+        
+        # Handle orientation if needed (Exif transpose)
+        ImageOps.exif_transpose(img, in_place=True)
+        
+        # Large
+        img.thumbnail(LARGE_SIZE)
+        timer.lap("resize")
+        large = encode_image(img, image_format, quality=LARGE_QUALITY)
+        width, height = img.size
+        timer.lap("encode")
+        
+        # Responsive variants, cascaded from the large rendition
+        variants, variant_outputs = encode_variants(img, key, timer)
+        
+        # Thumb, cascaded from the large rendition
+        img.thumbnail(THUMB_SIZE)
+        timer.lap("resize")
+        thumb = encode_image(img, image_format, quality=THUMB_QUALITY)
+        placeholder = make_placeholder(img)
+        timer.lap("encode")
+    
+    outputs = [(large_filename, large), (thumb_filename, thumb)] + variant_outputs
+    record = {
+        "w": width,
+        "h": height,
+        "files": [rel_path for rel_path, _ in outputs],
+        "variants": variants,
+        "placeholder_size": PLACEHOLDER_SIZE,
+        **placeholder
+    }
+    return record, outputs, timer.times
+
+def encode_in_worker(
+    data: bytes,
+    key: str,
+    suffix: str
+) -> Tuple[Dict[str, Any], List[Tuple[str, bytes]], Dict[str, float]]:
+    """
+    encode_renditions for a pool worker, with the worker's own resource use.
+    
+    Workers are forked by the forkserver rather than by the build, so the
+    build's RUSAGE_CHILDREN never sees them; each job reports its CPU seconds
+    (worker_cpu) and the worker's peak RSS so far (worker_rss_mb) instead.
+    """
+    cpu_start = time.process_time()
+    record, outputs, times = encode_renditions(data, key, suffix)
+    times["worker_cpu"] = time.process_time() - cpu_start
+    times["worker_rss_mb"] = _maxrss_mb(resource.RUSAGE_SELF) if resource else None
+    return record, outputs, times
+
+def write_renditions(key: str, record: Dict[str, Any], outputs: List[Tuple[str, bytes]]):
+    """Write encoded renditions into MEDIA_DIR and the rendition cache."""
+    for rel_path, data in outputs:
+        dest = MEDIA_DIR / rel_path
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        prepare_output(dest)
+        dest.write_bytes(data)
+    store_cached_rendition(key, record, outputs)
+
+def restore_rendition(key: str, suffix: str) -> Optional[Dict[str, Any]]:
+    """
+    Restore a cached rendition set into MEDIA_DIR.
+    
+    Entries cached before placeholders existed (or at another size) get them
+    derived from the thumbnail instead of re-encoding every rendition.
+    
+    Returns:
+        Cached record, or None on a miss
+    """
+    record = load_cached_rendition(key)
+    if record is not None and record.get("placeholder_size") != PLACEHOLDER_SIZE:
+        _, thumb_filename = media_filenames(key, suffix)
+        with Image.open(MEDIA_DIR / thumb_filename) as thumb:
+            record.update(make_placeholder(thumb), placeholder_size=PLACEHOLDER_SIZE)
+        update_cached_record(key, record)
+    return record
+
+def rendition_result(key: str, suffix: str, record: Dict[str, Any]) -> Dict[str, Any]:
+    """process_image's result for a cache record."""
+    large_filename, thumb_filename = media_filenames(key, suffix)
+    return {
+        "src": f"/media/{large_filename}",
+        "w": record["w"],
+        "h": record["h"],
+        "thumb": f"/media/{thumb_filename}",
+        "sources": build_sources(record["variants"]),
+        "placeholder": record["placeholder"],
+        "color": record["color"]
+    }
+
+def rendition_bytes(record: Dict[str, Any]) -> int:
+    """Total size of a record's files in MEDIA_DIR."""
+    return sum((MEDIA_DIR / rel_path).stat().st_size for rel_path in record["files"])
+
+def process_image(
+    img_path: Path,
+    key: Optional[str] = None,
+    stats: Optional[Dict[str, Any]] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Process a single image, reusing cached renditions when the source is unchanged.
+    
+    Runs the read, encode and write stages back to back; process_images
+    overlaps them across images. Output is content-addressed under
+    media/<key[:2]>/, so an original that appears in several albums is encoded
+    and stored once. EXIF metadata is not read here; main() joins it from
+    albums_metadata.json.
+    
+    Args:
+        img_path: Source image
+        key: Precomputed rendition_cache_key, computed here if omitted
+        stats: Optional dict filled with read/decode/resize/encode/write seconds, output bytes and cache hit
+    """
+    stats = {} if stats is None else stats
+    stats.update(cached=True)
+    try:
+        cache_key = key or rendition_cache_key(img_path)
+        record = restore_rendition(cache_key, img_path.suffix)
+        if record is None:
+            stats["cached"] = False
+            start = time.perf_counter()
+            data = img_path.read_bytes()
+            stats["read"] = time.perf_counter() - start
             
-            width, height = img_large.size
+            record, outputs, times = encode_renditions(data, cache_key, img_path.suffix)
+            stats.update(times)
             
-            return {
-                "src": f"/media/{album_slug}/{large_filename}",
-                "w": width,
-                "h": height,
-                "meta": meta,
-                "thumb": f"/media/{album_slug}/{thumb_filename}"
-            }
+            start = time.perf_counter()
+            write_renditions(cache_key, record, outputs)
+            stats["write"] = time.perf_counter() - start
+        
+        stats["bytes"] = rendition_bytes(record)
+        return rendition_result(cache_key, img_path.suffix, record)
     except Exception as e:
         print(f"Error processing {img_path}: {e}")
         return None
 
-def optimize_photo_order(photos: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def hash_sources(paths: List[Path], jobs: int = 1) -> List[Optional[str]]:
+    """
+    Rendition cache keys for paths, in the same order (None for unreadable files).
+    
+    hashlib releases the GIL while it hashes, so a thread pool is enough to
+    hash sources in parallel without starting worker processes.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        return list(pool.map(source_key, paths))
+
+class MemoryBudget:
     """
-    Reorder photos to pair portraits together for better grid layout.
+    Bytes of image data in flight. Callers are admitted in the order they
+    ask, so a large image waits for room rather than being starved by smaller
+    ones behind it; one costlier than the whole limit runs alone.
     """
-    portraits = []
-    landscapes = []
     
-    for p in photos:
-        w, h = p.get('w', 1), p.get('h', 1)
-        ratio = w / h if h else 1.0
-        
-        if ratio < 0.85: # Clear portrait
-            portraits.append(p)
-        else:
-            landscapes.append(p)
-            
-    # Create final list pairs
-    ordered = []
+    def __init__(self, limit: int = 0):
+        self.limit = limit
+        self.in_use = 0
+        self._changed = asyncio.Condition()
     
-    # Add pairs of portraits
-    for i in range(0, len(portraits), 2):
-        if i + 1 < len(portraits):
-            ordered.extend([portraits[i], portraits[i+1]])
-        else:
-            ordered.append(portraits[i]) # Orphan portrait
-            
-    # Add landscapes
-    ordered.extend(landscapes)
+    def _fits(self, cost: int) -> bool:
+        return not self.limit or not self.in_use or self.in_use + cost <= self.limit
+    
+    async def acquire(self, cost: int):
+        async with self._changed:
+            await self._changed.wait_for(lambda: self._fits(cost))
+            self.in_use += cost
     
-    return ordered
+    async def release(self, cost: int):
+        async with self._changed:
+            self.in_use -= cost
+            self._changed.notify_all()
 
-def select_cover_photo(photos: List[Dict[str, Any]], album_meta: dict) -> Dict[str, Any]:
+async def image_pipeline(
+    tasks: List[Tuple[Path, str]],
+    costs: List[int],
+    jobs: int = 1,
+    memory_budget: int = 0
+) -> AsyncIterator[Tuple[int, Optional[Dict[str, Any]], Dict[str, Any]]]:
+    """
+    Process images as three overlapping stages joined by bounded queues:
+    read sources (I/O threads) -> decode, resize and encode (worker processes)
+    -> write renditions (I/O threads).
+    
+    Each queue holds at most PIPELINE_QUEUE_DEPTH items per consumer, and a
+    source is only read once the memory budget has room for it, so readers
+    can't run ahead of the encoders and a slow disk can't pile up encoded
+    output. Cache hits are restored by the readers and skip the other stages.
+    
+    Args:
+        tasks: (image path, rendition key) pairs in build order
+        costs: Estimated peak bytes for each task (0 for cache hits)
+        jobs: Encoder worker processes (1 = one encoder thread, no pool)
+        memory_budget: Bytes of source and decoded image data allowed at once (0 = unlimited)
+    
+    Yields:
+        (task index, process_image result, per-image stats) in completion order
+    """
+    loop = asyncio.get_running_loop()
+    budget = MemoryBudget(memory_budget)
+    encode_job = encode_in_worker if jobs > 1 else encode_renditions
+    if jobs > 1:
+        # Workers start lazily while the reader and writer threads are running, and
+        # forking a threaded process can deadlock the child; forkserver forks them
+        # from a clean single-threaded server instead (Windows only has spawn)
+        start_methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("forkserver") if "forkserver" in start_methods else None
+        executor = ProcessPoolExecutor(max_workers=jobs, mp_context=context)
+    else:
+        executor = ThreadPoolExecutor(max_workers=1)
+    to_read = asyncio.Queue(PIPELINE_IO_WORKERS * PIPELINE_QUEUE_DEPTH)
+    to_encode = asyncio.Queue(jobs * PIPELINE_QUEUE_DEPTH)
+    to_write = asyncio.Queue(PIPELINE_IO_WORKERS * PIPELINE_QUEUE_DEPTH)
+    done = asyncio.Queue()
+    
+    async def fail(index: int, stats: Dict[str, Any], error: Exception):
+        print(f"Error processing {tasks[index][0]}: {error}")
+        await done.put((index, None, stats))
+    
+    async def admit():
+        for index, cost in enumerate(costs):
+            await budget.acquire(cost)
+            await to_read.put(index)
+    
+    async def read():
+        while (index := await to_read.get()) is not None:
+            path, key = tasks[index]
+            stats = {"cached": True}
+            try:
+                record = await asyncio.to_thread(restore_rendition, key, path.suffix)
+                if record is None:
+                    stats["cached"] = False
+                    start = time.perf_counter()
+                    data = await asyncio.to_thread(path.read_bytes)
+                    stats["read"] = time.perf_counter() - start
+                else:
+                    stats["bytes"] = await asyncio.to_thread(rendition_bytes, record)
+            except Exception as e:
+                await budget.release(costs[index])
+                await fail(index, stats, e)
+                continue
+            if record is None:
+                await to_encode.put((index, data, stats))
+                del data
+            else:
+                await budget.release(costs[index])
+                await done.put((index, rendition_result(key, path.suffix, record), stats))
+    
+    async def encode():
+        while (item := await to_encode.get()) is not None:
+            index, data, stats = item
+            del item
+            path, key = tasks[index]
+            try:
+                record, outputs, times = await loop.run_in_executor(executor, encode_job, data, key, path.suffix)
+            except Exception as e:
+                await fail(index, stats, e)
+                continue
+            finally:
+                del data
+                await budget.release(costs[index])
+            stats.update(times)
+            await to_write.put((index, record, outputs, stats))
+            del outputs
+    
+    async def write():
+        while (item := await to_write.get()) is not None:
+            index, record, outputs, stats = item
+            del item
+            path, key = tasks[index]
+            try:
+                start = time.perf_counter()
+                await asyncio.to_thread(write_renditions, key, record, outputs)
+                stats["write"] = time.perf_counter() - start
+                stats["bytes"] = sum(len(data) for _, data in outputs)
+            except Exception as e:
+                await fail(index, stats, e)
+                continue
+            finally:
+                del outputs
+            await done.put((index, rendition_result(key, path.suffix, record), stats))
+    
+    async def stage(worker, count: int, downstream: Optional[asyncio.Queue] = None, downstream_count: int = 0):
+        # Once every worker of a stage has stopped, stop the next stage's workers
+        await asyncio.gather(*(worker() for _ in range(count)))
+        for _ in range(downstream_count):
+            await downstream.put(None)
+    
+    stages = asyncio.gather(
+        stage(admit, 1, to_read, PIPELINE_IO_WORKERS),
+        stage(read, PIPELINE_IO_WORKERS, to_encode, jobs),
+        stage(encode, jobs, to_write, PIPELINE_IO_WORKERS),
+        stage(write, PIPELINE_IO_WORKERS)
+    )
+    try:
+        for _ in tasks:
+            result = asyncio.ensure_future(done.get())
+            await asyncio.wait({result, stages}, return_when=asyncio.FIRST_COMPLETED)
+            if not result.done():
+                # A stage died outside its per-image error handling
+                result.cancel()
+                stages.result()
+            yield result.result()
+        await stages
+    finally:
+        # Early exit (error or consumer stopped): stop the stages and collect their cancellation
+        stages.cancel()
+        await asyncio.gather(stages, return_exceptions=True)
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def iter_pipeline(
+    tasks: List[Tuple[Path, str]],
+    costs: List[int],
+    jobs: int = 1,
+    memory_budget: int = 0
+) -> Iterator[Tuple[Optional[Dict[str, Any]], Dict[str, Any]]]:
+    """Run image_pipeline on a private event loop, yielding (result, stats) in task order."""
+    loop = asyncio.new_event_loop()
+    results = image_pipeline(tasks, costs, jobs, memory_budget)
+    finished = {}
+    next_index = 0
+    try:
+        while next_index < len(tasks):
+            index, record, stats = loop.run_until_complete(anext(results))
+            finished[index] = (record, stats)
+            while next_index in finished:
+                yield finished.pop(next_index)
+                next_index += 1
+    finally:
+        loop.run_until_complete(results.aclose())
+        loop.run_until_complete(loop.shutdown_default_executor())
+        loop.close()
+
+def process_images(
+    tasks: List[Tuple[Path, str]],
+    jobs: int = 1,
+    memory_budget: int = 0
+) -> Iterator[Tuple[Optional[Dict[str, Any]], Dict[str, Any]]]:
+    """
+    Process images through the read/encode/write pipeline within a memory budget.
+    
+    Each source's footprint is estimated from its header; sources whose
+    renditions are already cached are free, since they are never decoded.
+    
+    Args:
+        tasks: (image path, rendition key) pairs in build order
+        jobs: Number of encoder processes (1 = encode in-process, no pool)
+        memory_budget: Bytes of source and decoded image data allowed at once (0 = unlimited)
+    
+    Yields:
+        (process_image result, per-image stats) in the same order as tasks
+    """
+    if not tasks:
+        return iter(())
+    
+    costs = [
+        0 if (_cache_entry_dir(key) / "record.json").exists() else estimate_image_memory(path)
+        for path, key in tasks
+    ]
+    if memory_budget:
+        oversized = sum(1 for cost in costs if cost > memory_budget)
+        print(
+            f"Memory budget {memory_budget / 2**20:.0f} MB; largest image needs ~{max(costs) / 2**20:.0f} MB"
+            + (f"; {oversized} image(s) exceed it and will run alone" if oversized else "")
+        )
+    return iter_pipeline(tasks, costs, jobs, memory_budget)
+
+def select_cover_photo(photos: List[Photo], album_meta: dict) -> Photo:
     """Select album cover photo with fallback."""
     cover_filename = album_meta.get("cover_filename")
     
     if cover_filename:
         for photo in photos:
-            if photo.get("src", "").endswith(cover_filename):
+            if photo.filename == cover_filename:
                 print(f"  Using specified cover: {cover_filename}")
                 return photo
         print(f"  Warning: Cover '{cover_filename}' not found, using first image")
     
     return photos[0]
 
-def apply_metadata_sort_order(photos: List[Dict[str, Any]], album_meta: dict) -> List[Dict[str, Any]]:
+def apply_metadata_sort_order(photos: List[Photo], album_meta: dict) -> List[Photo]:
     """Apply pre-computed sort order from metadata."""
     sort_map = {}
     for photo_meta in album_meta.get("photos", []):
@@ -158,21 +1204,14 @@ def apply_metadata_sort_order(photos: List[Dict[str, Any]], album_meta: dict) ->
             sort_map[filename] = sort_index
     
     if not sort_map:
-        return optimize_photo_order(photos)
+        # No scanner order: keep folder order; the justified layout handles mixed aspects
+        return photos
     
     def get_sort_key(photo):
-        src = photo.get("src", "")
-        filename = Path(src).name.replace("large_", "")
-        return sort_map.get(filename, 999)
+        return sort_map.get(photo.filename, 999)
     
     return sorted(photos, key=get_sort_key)
 
-def extract_filename(src_url: str) -> str:
-    """Extract original filename from processed URL."""
-    filename = Path(src_url).name
-    # Remove 'large_' prefix
-    return filename.replace("large_", "")
-
 def format_display_meta(meta: dict) -> dict:
     """Format metadata for display."""
     formatted = {}
@@ -204,18 +1243,20 @@ def format_display_meta(meta: dict) -> dict:
     
     return formatted
 
-def calculate_album_stats(photos: list) -> dict:
+def calculate_album_stats(photos: List[Photo]) -> dict:
     """Calculate album statistics."""
-    portrait_count = sum(1 for p in photos if (p["w"] / p["h"]) < 0.85)
+    portrait_count = sum(1 for p in photos if p.orientation == "portrait")
     landscape_count = len(photos) - portrait_count
     
     # Extract unique cameras
     cameras = set()
     dates = []
     for photo in photos:
-        meta = photo.get("meta", {})
-        if "camera" in meta:
-            cameras.add(meta["camera"])
+        meta = photo.metadata
+        if "camera_model" in meta:
+            cameras.add(meta["camera_model"])
+        if photo.taken:
+            dates.append(photo.taken)
     
     return {
         "total_photos": len(photos),
@@ -223,82 +1264,232 @@ def calculate_album_stats(photos: list) -> dict:
         "landscape_count": landscape_count,
         "cameras": sorted(list(cameras)),
         "date_range": {
-            "earliest": min(dates) if dates else None,
-            "latest": max(dates) if dates else None
+            "earliest": format_timestamp(min(dates)) if dates else None,
+            "latest": format_timestamp(max(dates)) if dates else None
         }
     }
 
-def find_album_navigation(current_slug: str, all_albums: list) -> Optional[dict]:
-    """Find previous and next albums for navigation."""
-    slugs = [a["slug"] for a in all_albums]
-    try:
-        current_idx = slugs.index(current_slug)
-        return {
-            "prev_album": slugs[current_idx - 1] if current_idx > 0 else None,
-            "next_album": slugs[current_idx + 1] if current_idx < len(slugs) - 1 else None
+def build_album_navigation(all_albums: List[Album]) -> Dict[str, dict]:
+    """Map each album slug to its previous and next album slugs, in one pass."""
+    slugs = [a.slug for a in all_albums]
+    return {
+        slug: {
+            "prev_album": slugs[idx - 1] if idx > 0 else None,
+            "next_album": slugs[idx + 1] if idx < len(slugs) - 1 else None
         }
+        for idx, slug in enumerate(slugs)
+    }
+
+def album_index_entry(album: Album) -> dict:
+    """Slim album summary for db.json and page navigation (no photo list)."""
+    return {
+        "slug": album.slug,
+        "title": album.title,
+        "subtitle": album.subtitle,
+        "summary": album.summary,
+        "cover": album.cover.thumb,
+        "cover_sources": album.cover.sources,
+        "cover_placeholder": album.cover.placeholder,
+        "cover_color": album.cover.color,
+        "photo_count": len(album.photos),
+        "shard": f"/db/{album.slug}.json"
+    }
+
+def write_db(albums_data: List[Album], album_index: list):
+    """
+    Write db.json as a small album index plus one shard per album.
+    
+    Both are compact JSON; each shard is serialized and written on its own
+    so only one album's document is in memory at a time.
+    
+    Args:
+        albums_data: Albums, serialized with their photos
+        album_index: album_index_entry for each album, same order
+    """
+    jsonio.dump({"albums": album_index}, DIST_DIR / "db.json", sort_keys=True)
+    
+    DB_SHARD_DIR.mkdir(parents=True, exist_ok=True)
+    for album in albums_data:
+        jsonio.dump(album.to_db(), DB_SHARD_DIR / f"{album.slug}.json", sort_keys=True)
+
+def latest_photo_time(photos: List[Photo]) -> Optional[datetime]:
+    """Most recent date_taken among photos, or None if none have one."""
+    return max((p.taken for p in photos if p.taken), default=None)
+
+def format_timestamp(value: datetime) -> str:
+    """UTC timestamp as ISO 8601 with a Z suffix."""
+    return value.isoformat().replace('+00:00', 'Z')
+
+def album_updated(album: Album) -> Optional[datetime]:
+    """An album's newest photo time, as precomputed by assemble_album."""
+    value = album.updated
+    return datetime.fromisoformat(value.replace('Z', '+00:00')) if value else None
+
+def source_date_epoch() -> Optional[datetime]:
+    """Explicit build time from the SOURCE_DATE_EPOCH convention, if set."""
+    value = os.getenv("SOURCE_DATE_EPOCH")
+    if not value:
+        return None
+    try:
+        return datetime.fromtimestamp(int(value), tz=timezone.utc)
     except ValueError:
+        print(f"Warning: ignoring invalid SOURCE_DATE_EPOCH '{value}'")
         return None
 
-def generate_sitemap(base_url: str, albums_data: list, build_time: datetime) -> str:
+class SitemapWriter:
     """
-    Generate XML sitemap for all pages.
+    Stream <url> entries into sitemap files, starting a new shard whenever
+    the protocol's per-file URL or size limit would be exceeded.
     
-    Args:
-        base_url: Site base URL (e.g., 'https://chrisrisner.com')
-        albums_data: List of album dictionaries with slug and photos
-        build_time: Current build timestamp
-        
-    Returns:
-        Complete XML sitemap as string
+    Shards are sitemap.xml, sitemap-2.xml, sitemap-3.xml, ... in out_dir.
     """
-    from xml.etree import ElementTree as ET
     
-    # Create root element
-    urlset = ET.Element('urlset', xmlns='http://www.sitemaps.org/schemas/sitemap/0.9')
+    HEADER = (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9" '
+        'xmlns:image="http://www.google.com/schemas/sitemap-image/1.1">\n'
+    )
+    FOOTER = '</urlset>\n'
     
-    # Add home page
-    url = ET.SubElement(urlset, 'url')
-    ET.SubElement(url, 'loc').text = f'{base_url}/'
-    ET.SubElement(url, 'lastmod').text = build_time.strftime('%Y-%m-%d')
-    ET.SubElement(url, 'changefreq').text = 'weekly'
-    ET.SubElement(url, 'priority').text = '1.0'
+    def __init__(self, out_dir: Path, base_url: str):
+        self.out_dir = out_dir
+        self.base_url = base_url
+        self.shards = []  # (filename, lastmod) per finished shard
+        self.url_count = 0
+        self._file = None
+        self._path = None
+        self._urls = 0
+        self._bytes = 0
+        self._lastmod = None
     
-    # Add album pages
-    for album in albums_data:
-        url = ET.SubElement(urlset, 'url')
-        ET.SubElement(url, 'loc').text = f'{base_url}/{album["slug"]}/'
+    @staticmethod
+    def shard_name(number: int) -> str:
+        return "sitemap.xml" if number == 1 else f"sitemap-{number}.xml"
+    
+    def _open(self):
+        self._path = self.out_dir / self.shard_name(len(self.shards) + 1)
+        self._file = open(self._path.with_name(self._path.name + ".tmp"), "w", encoding="utf-8")
+        self._file.write(self.HEADER)
+        self._urls = 0
+        self._bytes = len(self.HEADER)
+        self._lastmod = None
+    
+    def _close(self):
+        self._file.write(self.FOOTER)
+        self._file.close()
+        os.replace(self._path.with_name(self._path.name + ".tmp"), self._path)
+        self.shards.append((self._path.name, self._lastmod))
+        self._file = None
+    
+    def add(
+        self,
+        path: str,
+        lastmod: Optional[str] = None,
+        changefreq: Optional[str] = None,
+        priority: Optional[str] = None,
+        images: List[str] = ()
+    ):
+        """
+        Write one <url> entry.
         
-        # Extract last modified from most recent photo date
-        if album.get('photos'):
-            photo_dates = []
-            for photo in album['photos']:
-                if photo.get('meta', {}).get('date_taken'):
-                    try:
-                        # Parse "2026:01:08 20:16:24" format
-                        date_str = photo['meta']['date_taken'].split()[0]
-                        photo_dates.append(date_str.replace(':', '-'))
-                    except (IndexError, ValueError):
-                        pass
-            
-            if photo_dates:
-                ET.SubElement(url, 'lastmod').text = max(photo_dates)
+        Args:
+            path: Site-relative URL path, e.g. '/portugal/'
+            lastmod: W3C date (YYYY-MM-DD)
+            changefreq: Sitemap changefreq value
+            priority: Sitemap priority value
+            images: Site-relative image URLs (first SITEMAP_MAX_IMAGES are listed)
+        """
+        lines = ["  <url>", f"    <loc>{escape(self.base_url + path)}</loc>"]
+        if lastmod:
+            lines.append(f"    <lastmod>{lastmod}</lastmod>")
+        if changefreq:
+            lines.append(f"    <changefreq>{changefreq}</changefreq>")
+        if priority:
+            lines.append(f"    <priority>{priority}</priority>")
+        for image in images[:SITEMAP_MAX_IMAGES]:
+            lines.append(f"    <image:image><image:loc>{escape(self.base_url + image)}</image:loc></image:image>")
+        lines.append("  </url>\n")
+        entry = "\n".join(lines)
+        size = len(entry.encode("utf-8"))
         
-        ET.SubElement(url, 'changefreq').text = 'monthly'
-        ET.SubElement(url, 'priority').text = '0.8'
+        if self._file is None:
+            self._open()
+        elif self._urls >= SITEMAP_MAX_URLS or self._bytes + size + len(self.FOOTER) > SITEMAP_MAX_BYTES:
+            self._close()
+            self._open()
+        self._file.write(entry)
+        self._urls += 1
+        self._bytes += size
+        self.url_count += 1
+        if lastmod and (self._lastmod is None or lastmod > self._lastmod):
+            self._lastmod = lastmod
     
-    # Add about page
-    url = ET.SubElement(urlset, 'url')
-    ET.SubElement(url, 'loc').text = f'{base_url}/about/'
-    ET.SubElement(url, 'lastmod').text = build_time.strftime('%Y-%m-%d')
-    ET.SubElement(url, 'changefreq').text = 'yearly'
-    ET.SubElement(url, 'priority').text = '0.6'
+    def close(self) -> List[Tuple[str, Optional[str]]]:
+        """Finish the last shard, remove shards left over from larger builds, and return (filename, lastmod) pairs."""
+        if self._file is not None:
+            self._close()
+        written = {name for name, _ in self.shards}
+        for stale in self.out_dir.glob("sitemap-*.xml"):
+            if stale.name not in written:
+                stale.unlink()
+        return self.shards
+
+def generate_sitemap_index(base_url: str, shards: List[Tuple[str, Optional[str]]]) -> str:
+    """
+    Generate sitemap_index.xml content listing every sitemap shard.
+    
+    Args:
+        base_url: Site base URL
+        shards: (filename, lastmod) pairs from SitemapWriter.close()
+    """
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+    ]
+    for name, lastmod in shards:
+        lines.append("  <sitemap>")
+        lines.append(f"    <loc>{escape(f'{base_url}/{name}')}</loc>")
+        if lastmod:
+            lines.append(f"    <lastmod>{lastmod}</lastmod>")
+        lines.append("  </sitemap>")
+    lines.append("</sitemapindex>\n")
+    return "\n".join(lines)
+
+def write_sitemaps(base_url: str, albums_data: list, build_time: datetime, out_dir: Optional[Path] = None) -> str:
+    """
+    Stream the sitemap shards for all pages and return sitemap_index.xml content.
     
-    # Generate XML string with declaration
-    tree = ET.ElementTree(urlset)
-    ET.indent(tree, space='  ')  # Pretty print with 2-space indent
+    Album pages list their photos' large renditions as image:image entries and
+    use the album's precomputed "updated" date as lastmod.
+    
+    Args:
+        base_url: Site base URL (e.g., 'https://chrisrisner.com')
+        albums_data: Albums from assemble_album
+        build_time: lastmod for the home and about pages
+        out_dir: Where the shards are written (defaults to DIST_DIR)
+        
+    Returns:
+        sitemap_index.xml content
+    """
+    out_dir = out_dir or DIST_DIR
+    build_date = build_time.strftime('%Y-%m-%d')
+    writer = SitemapWriter(out_dir, base_url)
     
-    return '<?xml version="1.0" encoding="UTF-8"?>\n' + ET.tostring(urlset, encoding='unicode')
+    writer.add('/', build_date, 'weekly', '1.0')
+    for album in albums_data:
+        lastmod = album.updated[:10] if album.updated else None
+        writer.add(
+            f'/{album.slug}/',
+            lastmod,
+            'monthly',
+            '0.8',
+            images=[photo.src for photo in album.photos]
+        )
+    writer.add('/about/', build_date, 'yearly', '0.6')
+    
+    shards = writer.close()
+    print(f"Sitemap generated with {writer.url_count} URLs in {len(shards)} file(s)")
+    return generate_sitemap_index(base_url, shards)
 
 def generate_robots_txt(base_url: str) -> str:
     """
@@ -317,198 +1508,677 @@ User-agent: *
 Allow: /
 
 # Sitemap location
-Sitemap: {base_url}/sitemap.xml
+Sitemap: {base_url}/sitemap_index.xml
 """
 
 def generate_album_metadata(
-    album: dict,
-    all_albums: list,
-    builder_version: str = "1.0.0"
+    album: Album,
+    navigation: Optional[dict],
+    builder_version: str = "1.0.0",
+    generated_at: Optional[datetime] = None
 ) -> dict:
     """
     Generate per-album metadata structure.
     
     Args:
-        album: Album dict with slug, title, photos
-        all_albums: List of all albums (for navigation)
+        album: Album from assemble_album
+        navigation: Previous/next album slugs from build_album_navigation
         builder_version: Build script version
+        generated_at: Timestamp to record (defaults to now; fixed for reproducible builds)
     
     Returns:
         Complete metadata dict ready for JSON serialization
     """
-    photos = album["photos"]
+    photos = album.photos
     
     # Calculate statistics
     stats = calculate_album_stats(photos)
     
-    # Find navigation
-    navigation = find_album_navigation(album["slug"], all_albums)
-    
     # Build complete metadata
     metadata = {
-        "slug": album["slug"],
-        "title": album["title"],
-        "folder": album.get("folder", album["title"]),
+        "slug": album.slug,
+        "title": album.title,
+        "folder": album.title,
         "photos": [
             {
-                "filename": extract_filename(p["src"]),
-                "src": p["src"],
-                "thumb": p["thumb"],
-                "w": p["w"],
-                "h": p["h"],
-                "aspect_ratio": round(p["w"] / p["h"], 3) if p["h"] > 0 else 1.0,
-                "orientation": "portrait" if (p["w"] / p["h"]) < 0.85 else "landscape",
+                "filename": p.filename,
+                "src": p.src,
+                "thumb": p.thumb,
+                "w": p.width,
+                "h": p.height,
+                "aspect_ratio": round(p.aspect_ratio, 3),
+                "orientation": p.orientation,
                 "sort_index": idx,
-                "meta": format_display_meta(p.get("meta", {}))
+                "cell": p.cell,
+                "color": p.color,
+                "placeholder": p.placeholder,
+                "meta": format_display_meta(p.metadata)
             }
             for idx, p in enumerate(photos)
         ],
+        "layout": album.layout,
         "stats": stats,
         "navigation": navigation,
         "generated": {
-            "timestamp": datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z'),
+            "timestamp": (generated_at or datetime.now(timezone.utc)).isoformat().replace('+00:00', 'Z'),
             "builder_version": builder_version
         }
     }
     
     return metadata
 
-def main() -> int:
-    """Main build entry point."""
-    print("Starting build process...")
-    setup_directories()
-    
-    # Load albums metadata
-    albums_metadata = {}
-    metadata_file = Path("albums_metadata.json")
-    if metadata_file.exists():
-        print("Loading albums_metadata.json...")
-        with open(metadata_file) as f:
-            albums_metadata = json.load(f)
-    
-    albums_data = []
+def load_albums_metadata(metadata_file: Path = Path("albums_metadata.json")) -> Dict[str, Any]:
+    """Load scanner output, or an empty dict if it doesn't exist."""
+    if not metadata_file.exists():
+        return {}
+    print(f"Loading {metadata_file}...")
+    return jsonio.load(metadata_file)
 
-    if not ALBUMS_DIR.exists():
-        print(f"Error: {ALBUMS_DIR} not found.")
-        return 1
+def album_slug_for(folder_name: str) -> str:
+    """URL slug for an album folder."""
+    return folder_name.lower().replace(" ", "-")
 
+def list_albums() -> List[Tuple[Path, str, List[Path]]]:
+    """
+    List album folders and their images in build order.
+    
+    Returns:
+        (album path, album slug, sorted image paths) per non-hidden folder
+    """
+    albums = []
     for album_path in sorted(ALBUMS_DIR.iterdir()):
         if not album_path.is_dir() or album_path.name.startswith('.'):
             continue
-            
-        album_slug = album_path.name.lower().replace(" ", "-")
-        print(f"Processing Album: {album_path.name}")
+        images = [p for p in sorted(album_path.iterdir()) if p.suffix in VALID_EXTENSIONS]
+        albums.append((album_path, album_slug_for(album_path.name), images))
+    return albums
+
+def assemble_album(
+    album_path: Path,
+    album_slug: str,
+    images: List[Path],
+    results: List[Optional[Dict[str, Any]]],
+    album_meta: dict
+) -> Optional[Album]:
+    """
+    Build an Album from processed images and scanner metadata.
+    
+    Args:
+        album_path: Album folder
+        album_slug: URL slug for the album
+        images: Source images, in folder order
+        results: process_image output for each image (None = failed, skipped)
+        album_meta: This album's entry from albums_metadata.json
+    
+    Returns:
+        Album, or None if no image could be processed
+    """
+    # EXIF comes from the scanner, joined by filename
+    exif_by_filename = {
+        p["filename"]: p.get("metadata", {})
+        for p in album_meta.get("photos", [])
+        if "filename" in p
+    }
+    
+    photos = []
+    missing_meta = 0
+    for img_path, photo_data in zip(images, results):
+        if photo_data:
+            # Shared renditions get their own per-album record
+            if img_path.name not in exif_by_filename:
+                missing_meta += 1
+            metadata = exif_by_filename.get(img_path.name, {})
+            photos.append(Photo.from_rendition(img_path.name, photo_data, metadata))
+    
+    if missing_meta:
+        print(f"  Warning: {missing_meta} photo(s) missing from albums_metadata.json; run src/scan_albums.py")
+    
+    # Apply metadata-driven sort order or fallback to runtime algorithm
+    photos = apply_metadata_sort_order(photos, album_meta)
+    
+    if not photos:
+        return None
+    
+    # Select cover photo (manual or first)
+    cover_photo = select_cover_photo(photos, album_meta)
+    
+    # Newest photo date, computed once for sitemap lastmod and reproducible timestamps
+    updated = latest_photo_time(photos)
+    
+    # Row breaks and cell sizes for the gallery grid (fills photo.cell)
+    layout = justified_layout(photos, LAYOUT_PROFILES)
+    
+    return Album(
+        slug=album_slug,
+        title=album_path.name,
+        subtitle=album_meta.get("subtitle", ""),
+        summary=album_meta.get("summary", ""),
+        cover=cover_photo,
+        updated=format_timestamp(updated) if updated else None,
+        layout=layout,
+        photos=photos
+    )
+
+def _maxrss_mb(who: int) -> float:
+    """ru_maxrss of getrusage(who), in MB."""
+    # ru_maxrss is KB on Linux, bytes on macOS
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(resource.getrusage(who).ru_maxrss / divisor, 1)
+
+def peak_rss_mb() -> Optional[float]:
+    """
+    Peak resident set size of this process and its reaped children, in MB.
+    Encode workers are not its children; BuildProfiler adds what they report.
+    """
+    if resource is None:
+        return None
+    return max(_maxrss_mb(resource.RUSAGE_SELF), _maxrss_mb(resource.RUSAGE_CHILDREN))
+
+def _cpu_seconds() -> float:
+    """
+    CPU time used by this process plus reaped child processes. Encode workers
+    are not its children; BuildProfiler adds what they report.
+    """
+    if resource is None:
+        return time.process_time()
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+class BuildProfiler:
+    """Per-stage wall/CPU timings and per-image stats, cheap enough to always collect."""
+    
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = []
+        self.images = []
+        # Resource use reported by encode workers (see encode_in_worker)
+        self.worker_cpu = 0.0
+        self.worker_rss_mb = None
+    
+    @contextmanager
+    def stage(self, name: str):
+        """Time a build stage (wall clock and CPU, including worker processes)."""
+        wall_start = time.perf_counter()
+        cpu_start = _cpu_seconds() + self.worker_cpu
+        try:
+            yield
+        finally:
+            self.stages.append({
+                "name": name,
+                "wall_seconds": round(time.perf_counter() - wall_start, 4),
+                "cpu_seconds": round(_cpu_seconds() + self.worker_cpu - cpu_start, 4)
+            })
+    
+    def add_image(self, img_path: Path, stats: Dict[str, Any]):
+        """Record one image's process_image stats."""
+        entry = {"path": img_path.as_posix()}
+        for kind in IMAGE_STAGES:
+            entry[f"{kind}_seconds"] = round(stats.get(kind, 0.0), 4)
+        entry["total_seconds"] = round(sum(stats.get(k, 0.0) for k in IMAGE_STAGES), 4)
+        entry["output_bytes"] = stats.get("bytes", 0)
+        entry["cached"] = stats.get("cached", False)
+        entry["failed"] = "bytes" not in stats
+        self.images.append(entry)
+        self.worker_cpu += stats.get("worker_cpu", 0.0)
+        if stats.get("worker_rss_mb") is not None:
+            self.worker_rss_mb = max(self.worker_rss_mb or 0.0, stats["worker_rss_mb"])
+    
+    def report(self, top_n: int = 10) -> Dict[str, Any]:
+        """Build report as a JSON-serializable dict."""
+        processed = [i for i in self.images if not i["cached"]]
+        peak_rss = max((mb for mb in (peak_rss_mb(), self.worker_rss_mb) if mb is not None), default=None)
+        return {
+            "generated": datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z'),
+            "total_wall_seconds": round(time.perf_counter() - self.started, 4),
+            "peak_rss_mb": peak_rss,
+            "stages": self.stages,
+            "images": {
+                "count": len(self.images),
+                "processed": len(processed),
+                "cached": len(self.images) - len(processed),
+                "failed": sum(1 for i in self.images if i["failed"]),
+                "output_bytes": sum(i["output_bytes"] for i in self.images),
+                **{
+                    f"{kind}_seconds": round(sum(i[f"{kind}_seconds"] for i in self.images), 4)
+                    for kind in IMAGE_STAGES
+                }
+            },
+            "slowest_images": sorted(self.images, key=lambda i: i["total_seconds"], reverse=True)[:top_n]
+        }
+    
+    def save(self, path: Path, top_n: int = 10) -> Dict[str, Any]:
+        """Write the report as JSON and return it."""
+        report = self.report(top_n)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        jsonio.dump(report, path, indent=True)
+        return report
+
+def print_profile(report: Dict[str, Any]):
+    """Print a human-readable summary of a build report."""
+    print("\nBuild profile:")
+    for stage in report["stages"]:
+        print(f"  {stage['name']:<20} {stage['wall_seconds']:>9.3f}s wall {stage['cpu_seconds']:>9.3f}s cpu")
+    images = report["images"]
+    print(
+        f"  images: {images['processed']} processed, {images['cached']} cached, {images['failed']} failed; "
+        f"read {images['read_seconds']:.2f}s, decode {images['decode_seconds']:.2f}s, "
+        f"resize {images['resize_seconds']:.2f}s, encode {images['encode_seconds']:.2f}s, "
+        f"write {images['write_seconds']:.2f}s, {images['output_bytes'] / 1e6:.1f} MB out"
+    )
+    if report["peak_rss_mb"] is not None:
+        print(f"  peak RSS: {report['peak_rss_mb']} MB")
+    for image in report["slowest_images"]:
+        if image["total_seconds"] > 0:
+            print(f"  {image['total_seconds']:>7.3f}s  {image['path']}")
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Build the static portfolio site.")
+    parser.add_argument(
+        "--jobs", "-j",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of worker processes encoding images (default: CPU count, 1 = in-process)"
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=int,
+        metavar="MB",
+        help=(
+            "Decoded image memory allowed across workers at once; workers wait for room "
+            f"(default: {MEMORY_BUDGET_FRACTION:.0%} of RAM, 0 = unlimited)"
+        )
+    )
+    parser.add_argument(
+        "--reproducible",
+        action="store_true",
+        help="Derive timestamps from photo dates (or SOURCE_DATE_EPOCH) so unchanged content yields identical bytes"
+    )
+    parser.add_argument(
+        "--no-compress",
+        dest="compress",
+        action="store_false",
+        help="Skip writing .gz/.br variants of text outputs"
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help=f"Continue an interrupted build in {STAGING_DIR}/, skipping images and pages it already finished"
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help=f"Print per-stage timings and write {PUBLISH_DIR / BUILD_REPORT_NAME}"
+    )
+    parser.add_argument(
+        "--profile-top",
+        type=int,
+        default=10,
+        help="Number of slowest images to list in the profile (default: 10)"
+    )
+    parser.add_argument(
+        "--profile-output",
+        type=Path,
+        metavar="PATH",
+        help="Write the profile report to PATH instead of into the site (implies --profile)"
+    )
+    args = parser.parse_args(argv)
+    if args.profile_output:
+        args.profile = True
+    return args
+
+def create_environment(asset_manifest: Optional[Dict[str, str]] = None) -> Environment:
+    """
+    Jinja environment with an on-disk bytecode cache that survives across builds.
+    
+    Templates reference static files as {{ base_url }}{{ asset('style.css') }},
+    which resolves through asset_manifest (plain names when it is omitted).
+    """
+    TEMPLATE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    env = Environment(
+        loader=FileSystemLoader(TEMPLATE_DIR),
+        bytecode_cache=FileSystemBytecodeCache(str(TEMPLATE_CACHE_DIR))
+    )
+    env.globals["asset"] = partial(asset_url, asset_manifest or {})
+    return env
+
+def render_album_metadata(album: Album, navigation: Optional[dict], generated_at: Optional[datetime]) -> str:
+    """Serialize an album's metadata.json (compact)."""
+    metadata = generate_album_metadata(album, navigation, builder_version="1.0.0", generated_at=generated_at)
+    return render_json(metadata)
+
+def render_json(doc: Any) -> str:
+    """Serialize a generated JSON output (compact, sorted keys)."""
+    return jsonio.dumps(doc, sort_keys=True).decode("utf-8")
+
+def fingerprint_inputs(*inputs: Any) -> str:
+    """Hash JSON-serializable inputs into a stable fingerprint."""
+    payload = json.dumps(inputs, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def template_fingerprint(env: Environment, name: str, _memo: Optional[Dict[str, str]] = None) -> str:
+    """
+    Fingerprint a template together with every template it extends, includes or imports.
+    
+    Args:
+        env: Jinja environment used for rendering
+        name: Template name
         
-        photos = []
-        valid_extensions = {".jpg", ".jpeg", ".png", ".webp", ".JPG", ".JPEG"}
+    Returns:
+        SHA-256 hex digest covering the template's full inheritance chain
+    """
+    memo = {} if _memo is None else _memo
+    if name in memo:
+        return memo[name]
+    
+    source, _, _ = env.loader.get_source(env, name)
+    digest = hashlib.sha256(source.encode("utf-8"))
+    memo[name] = digest.hexdigest()  # Guards against reference cycles
+    for ref in sorted(r for r in meta.find_referenced_templates(env.parse(source)) if r):
+        digest.update(template_fingerprint(env, ref, memo).encode("utf-8"))
+    memo[name] = digest.hexdigest()
+    return memo[name]
+
+class OutputCache:
+    """Skip regenerating outputs whose input fingerprint is unchanged since the last build."""
+    
+    def __init__(self, state_file: Path = PAGE_STATE_FILE, journal: Optional[BuildJournal] = None):
+        self.state_file = state_file
+        self.journal = journal
+        self.written = 0
+        self.skipped = 0
+        self.new_state = {}
+        self._lock = threading.Lock()
+        # The builder's own code and templates are inputs to every output
+        self.builder_fingerprint = builder_fingerprint()
+        try:
+            self.state = jsonio.load(state_file)
+        except (OSError, jsonio.JSONDecodeError):
+            self.state = {}
+        if journal:
+            # Outputs finished by an interrupted build are already in the staging tree
+            self.state.update(journal.pages)
+    
+    def write(self, output_path: Path, inputs: Any, render: Callable[[], str]) -> bool:
+        """
+        Render and write output_path unless its inputs are unchanged.
         
-        for img_path in sorted(album_path.iterdir()):
-            if img_path.suffix in valid_extensions:
-                photo_data = process_image(img_path, album_slug)
-                if photo_data:
-                    photos.append(photo_data)
+        Args:
+            output_path: File to produce, inside DIST_DIR
+            inputs: Everything the output depends on (JSON-serializable)
+            render: Produces the file content; only called when needed
+            
+        Returns:
+            True if the file was written, False if skipped
+        """
+        key = output_path.relative_to(DIST_DIR).as_posix()
+        fingerprint = fingerprint_inputs(self.builder_fingerprint, inputs)
+        with self._lock:
+            self.new_state[key] = fingerprint
+        if self.state.get(key) == fingerprint and output_path.exists():
+            with self._lock:
+                self.skipped += 1
+            return False
         
-        # Get album metadata if available
-        album_meta = albums_metadata.get(album_path.name, {})
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        # Write beside and rename, so a killed build never leaves a torn file
+        tmp_path = output_path.with_name(output_path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(render())
+        os.replace(tmp_path, output_path)
+        if self.journal:
+            self.journal.record_page(key, fingerprint)
+        with self._lock:
+            self.written += 1
+        return True
+    
+    def write_all(self, pages: List[Tuple[Path, Any, Callable[[], str]]], workers: int = 1):
+        """
+        Write many outputs, rendering and writing concurrently on a thread pool.
         
-        # Apply metadata-driven sort order or fallback to runtime algorithm
-        photos = apply_metadata_sort_order(photos, album_meta)
+        Args:
+            pages: (output path, inputs, render) tuples as accepted by write()
+            workers: Number of threads (1 = serial)
+        """
+        if workers <= 1 or len(pages) <= 1:
+            for page in pages:
+                self.write(*page)
+            return
         
-        if photos:
-            # Select cover photo (manual or first)
-            cover_photo = select_cover_photo(photos, album_meta)
-            
-            albums_data.append({
-                "slug": album_slug,
-                "title": album_path.name,
-                "subtitle": album_meta.get("subtitle", ""),
-                "summary": album_meta.get("summary", ""),
-                "cover": cover_photo["thumb"],
-                "photos": photos
-            })
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # list() re-raises the first render error, if any
+            list(pool.map(lambda page: self.write(*page), pages))
+    
+    def save(self):
+        """Persist fingerprints for the outputs produced by this build."""
+        self.state_file.parent.mkdir(parents=True, exist_ok=True)
+        jsonio.dump(self.new_state, self.state_file)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Main build entry point."""
+    args = parse_args(argv)
+    profiler = BuildProfiler()
+    print("Starting build process...")
+    
+    if not ALBUMS_DIR.exists():
+        print(f"Error: {ALBUMS_DIR} not found.")
+        return 1
+    
+    # Build into a staging tree; dist/ is only replaced once everything is written
+    with profiler.stage("setup_directories"):
+        recover_interrupted_publish()
+        journal = prepare_staging(args.resume)
+        set_output_dir(STAGING_DIR)
+        asset_manifest = setup_directories()
+    
+    albums_metadata = load_albums_metadata()
+
+    with profiler.stage("hash_sources"):
+        # Collect every image up front so the pool can work across album boundaries
+        album_tasks = list_albums()
+        
+        # Hash sources first so identical originals across albums are processed once
+        paths = [img_path for _, _, images in album_tasks for img_path in images]
+        jobs = max(1, args.jobs)
+        keys = hash_sources(paths, jobs)
+        unique_sources = {}
+        for path, key in zip(paths, keys):
+            if key and key not in unique_sources:
+                unique_sources[key] = path
+        unique_tasks = [(path, key) for key, path in unique_sources.items()]
+    print(f"Processing {len(unique_tasks)} unique images ({len(paths)} total) with {jobs} worker(s)...")
+    
+    with profiler.stage("image_processing"):
+        start = time.perf_counter()
+        # Images finished before an interruption are already in the staging tree
+        results_by_key = {key: journal.images[key] for _, key in unique_tasks if key in journal.images}
+        pending = [(path, key) for path, key in unique_tasks if key not in results_by_key]
+        memory_budget = default_memory_budget() if args.memory_budget is None else args.memory_budget * 2**20
+        for (path, key), (record, stats) in zip(pending, process_images(pending, jobs, memory_budget)):
+            results_by_key[key] = record
+            profiler.add_image(path, stats)
+            if record is not None:
+                journal.record_image(key, record)
+        elapsed = time.perf_counter() - start
+    rate = len(pending) / elapsed if elapsed > 0 else 0.0
+    print(f"Processed {len(pending)} images in {elapsed:.2f}s ({rate:.1f} images/sec)")
+    results = iter(results_by_key.get(key) for key in keys)
     
-    db = {"albums": albums_data}
+    albums_data = []
+    for album_path, album_slug, images in album_tasks:
+        print(f"Processing Album: {album_path.name}")
+        album_results = [next(results) for _ in images]
+        album_meta = albums_metadata.get(album_path.name, {})
+        album = assemble_album(album_path, album_slug, images, album_results, album_meta)
+        if album:
+            albums_data.append(album)
+    
+    album_index = [album_index_entry(album) for album in albums_data]
+    navigation = build_album_navigation(albums_data)
     
-    # Save DB
-    with open(DIST_DIR / "db.json", "w") as f:
-        json.dump(db, f, indent=2)
+    # Save DB (index + per-album shards)
+    with profiler.stage("db_write"):
+        write_db(albums_data, album_index)
     print(f"Database generated with {len(albums_data)} albums.")
         
+    outputs = OutputCache(journal=journal)
+    
+    # Cross-album camera/lens/date index for client-side filtering
+    with profiler.stage("search_index"):
+        search_docs = build_search_index(albums_data)
+        outputs.write_all([
+            (DIST_DIR / SEARCH_DIR / name, doc, partial(render_json, doc))
+            for name, doc in search_docs.items()
+        ], jobs)
+    print(f"Search index generated in {len(search_docs)} files.")
+    
     # Generate HTML
     if (TEMPLATE_DIR / "index.html").exists():
-        env = Environment(loader=FileSystemLoader(TEMPLATE_DIR))
+        env = create_environment(asset_manifest)
         template = env.get_template("index.html")
+        # Pages change when a template or any static asset they reference changes
+        index_fingerprint = [template_fingerprint(env, "index.html"), asset_manifest]
+        pages = []
+        
+        # Reproducible builds take time from SOURCE_DATE_EPOCH, else from photo dates
+        epoch = source_date_epoch()
+        reproducible = args.reproducible or epoch is not None
+        album_times = [t for t in map(album_updated, albums_data) if t]
+        site_time = epoch or max(album_times, default=None) or datetime.fromtimestamp(0, tz=timezone.utc)
         
-        # 1. Generate Home Page
-        print("Generating Home Page...")
-        home_html = template.render(db=db, current_album=None, base_url=BASE_URL)
-        with open(DIST_DIR / "index.html", "w") as f:
-            f.write(home_html)
+        def album_time(album: Album) -> datetime:
+            return epoch or album_updated(album) or site_time
+        
+        # 1. Home Page
+        pages.append((
+            DIST_DIR / "index.html",
+            [index_fingerprint, album_index, BASE_URL],
+            partial(template.render, albums=album_index, current_album=None, base_url=BASE_URL)
+        ))
             
-        # 2. Generate Album Pages
-        print("Generating Album Pages...")
+        # 2. Album Pages and per-album metadata.json
         for album in albums_data:
-            slug = album["slug"]
+            slug = album.slug
             album_dir = DIST_DIR / slug
-            album_dir.mkdir(exist_ok=True, parents=True)
+            # The shard document covers everything the page and metadata render from
+            album_doc = album.to_db()
             
-            album_html = template.render(db=db, current_album=album, base_url=BASE_URL)
-            with open(album_dir / "index.html", "w") as f:
-                f.write(album_html)
+            pages.append((
+                album_dir / "index.html",
+                [index_fingerprint, album_index, album_doc, navigation[slug], BASE_URL],
+                partial(
+                    template.render,
+                    albums=album_index,
+                    current_album=album,
+                    navigation=navigation[slug],
+                    base_url=BASE_URL
+                )
+            ))
             
-            # Generate per-album metadata.json
-            album_metadata = generate_album_metadata(album, albums_data, builder_version="1.0.0")
-            with open(album_dir / "metadata.json", "w") as f:
-                json.dump(album_metadata, f, indent=2)
-                
-        print(f"Generated home and {len(albums_data)} album pages.")
+            generated_at = album_time(album) if reproducible else None
+            pages.append((
+                album_dir / "metadata.json",
+                [album_doc, navigation[slug], "1.0.0", generated_at],
+                partial(render_album_metadata, album, navigation[slug], generated_at)
+            ))
 
-        # 3. Generate 404 Page
-        print("Generating 404 Page...")
+        # 3. 404 Page
         if (TEMPLATE_DIR / "404.html").exists():
             template_404 = env.get_template("404.html")
-            html_404 = template_404.render(db=db, base_url=BASE_URL)
-            with open(DIST_DIR / "404.html", "w") as f:
-                f.write(html_404)
+            pages.append((
+                DIST_DIR / "404.html",
+                [template_fingerprint(env, "404.html"), asset_manifest, album_index, BASE_URL],
+                partial(template_404.render, albums=album_index, base_url=BASE_URL)
+            ))
         else:
             print("Warning: 404.html template not found.")
 
-
-        # 4. Generate About Page
+        # 4. About Page
         if (TEMPLATE_DIR / "about.html").exists():
-            print("Generating About Page...")
             template_about = env.get_template("about.html")
-            about_html = template_about.render(db=db, base_url=BASE_URL)
-            about_dir = DIST_DIR / "about"
-            about_dir.mkdir(exist_ok=True, parents=True)
-            with open(about_dir / "index.html", "w") as f:
-                f.write(about_html)
+            pages.append((
+                DIST_DIR / "about" / "index.html",
+                [template_fingerprint(env, "about.html"), asset_manifest, album_index, BASE_URL],
+                partial(template_about.render, albums=album_index, base_url=BASE_URL)
+            ))
         else:
             print("Warning: about.html template not found.")
 
-        # 5. Generate Sitemap
-        print("Generating sitemap.xml...")
+        print(f"Rendering {len(pages)} pages with {jobs} thread(s)...")
+        with profiler.stage("rendering"):
+            outputs.write_all(pages, jobs)
+        print(f"Generated home and {len(albums_data)} album pages.")
+
+        # 5. Sitemaps (shards written as a side effect of the index) and robots.txt
+        print("Generating sitemaps and robots.txt...")
         base_url = BASE_URL or "https://chrisrisner.com"
-        build_time = datetime.now(timezone.utc)
-        sitemap_content = generate_sitemap(base_url, albums_data, build_time)
-        
-        with open(DIST_DIR / "sitemap.xml", "w", encoding="utf-8") as f:
-            f.write(sitemap_content)
-        
-        print(f"Sitemap generated with {len(albums_data) + 2} URLs")
-        
-        # 6. Generate robots.txt
-        print("Generating robots.txt...")
-        robots_content = generate_robots_txt(base_url)
-        
-        with open(DIST_DIR / "robots.txt", "w", encoding="utf-8") as f:
-            f.write(robots_content)
-        
-        print("robots.txt generated")
+        build_time = site_time if reproducible else datetime.now(timezone.utc)
+        with profiler.stage("sitemap"):
+            outputs.write(
+                DIST_DIR / "sitemap_index.xml",
+                [
+                    base_url,
+                    [(a.slug, a.updated, [p.src for p in a.photos]) for a in albums_data],
+                    build_time.strftime('%Y-%m-%d'),
+                    SITEMAP_MAX_URLS,
+                    SITEMAP_MAX_IMAGES
+                ],
+                partial(write_sitemaps, base_url, albums_data, build_time, DIST_DIR)
+            )
+            outputs.write(DIST_DIR / "robots.txt", [base_url], partial(generate_robots_txt, base_url))
+        print(f"Pages: {outputs.written} written, {outputs.skipped} unchanged and skipped.")
 
     else:
         print("Warning: index.html template not found.")
 
+    # Drop outputs of removed photos and albums before they are compressed or hashed
+    with profiler.stage("prune"):
+        live = live_outputs(albums_data, list(outputs.new_state))
+        if args.profile and not args.profile_output:
+            # Kept only when this build writes a fresh one
+            live.add(BUILD_REPORT_NAME)
+        removed = prune_outputs(DIST_DIR, live)
+    if removed:
+        print(f"Pruned {len(removed)} orphaned output file(s).")
+    
+    if args.compress:
+        with profiler.stage("precompress"):
+            text_files, variants = precompress_outputs(DIST_DIR, jobs)
+        formats = " and ".join(suffix for suffix, _ in compressors())
+        print(f"Precompressed {text_files} text files ({variants} new {formats} variants).")
+    
+    if args.profile:
+        report = profiler.save(args.profile_output or DIST_DIR / BUILD_REPORT_NAME, args.profile_top)
+    
+    previous_manifest = load_manifest()
+    manifest = build_manifest(DIST_DIR, previous_manifest)
+    changes = diff_manifests(previous_manifest, manifest)
+    
+    # Publish. Once the journal is gone the staging tree counts as complete,
+    # and recover_interrupted_publish() will finish an interrupted swap.
+    journal.finish()
+    outputs.save()
+    publish_staging()
+    set_output_dir(PUBLISH_DIR)
+    print(f"Published build to {PUBLISH_DIR}/")
+    
+    # Only after a successful publish, so an interrupted build keeps its entries
+    evicted = prune_rendition_cache({key for _, key in unique_tasks})
+    if evicted:
+        print(f"Evicted {evicted} unused entries from {RENDITION_CACHE_DIR}/.")
+    
+    jsonio.dump(manifest, DIST_MANIFEST_FILE, sort_keys=True)
+    jsonio.dump(changes, DIST_CHANGES_FILE, indent=True)
+    print(
+        f"Changes: {len(changes['added'])} added, {len(changes['changed'])} changed, "
+        f"{len(changes['removed'])} removed (listed in {DIST_CHANGES_FILE})"
+    )
+
+    if args.profile:
+        print_profile(report)
+        print(f"Build report written to {args.profile_output or PUBLISH_DIR / BUILD_REPORT_NAME}")
+
     return 0
 
 if __name__ == "__main__":
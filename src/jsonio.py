@@ -0,0 +1,111 @@
+"""
+JSON helpers shared by the scanner, builder and preview server.
+Uses orjson when it is installed and falls back to the standard library.
+Output is UTF-8 and compact unless indent is requested.
+"""
+
+import os
+import json
+from pathlib import Path
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:  # Optional speedup
+    orjson = None
+
+PathLike = Union[str, Path]
+
+# Raised by loads() on malformed input, whichever backend is active
+JSONDecodeError = orjson.JSONDecodeError if orjson else json.JSONDecodeError
+
+def backend() -> str:
+    """Name of the active JSON backend."""
+    return "orjson" if orjson else "json"
+
+def dumps(obj: Any, indent: bool = False, sort_keys: bool = False) -> bytes:
+    """
+    Serialize obj to UTF-8 JSON bytes.
+
+    Args:
+        obj: JSON-serializable value
+        indent: Pretty-print with two-space indentation (for hand-edited files)
+        sort_keys: Sort object keys for stable output
+    """
+    if orjson:
+        option = 0
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, option=option)
+    if indent:
+        text = json.dumps(obj, indent=2, sort_keys=sort_keys, ensure_ascii=False)
+    else:
+        text = json.dumps(obj, separators=(",", ":"), sort_keys=sort_keys, ensure_ascii=False)
+    return text.encode("utf-8")
+
+def loads(data: Union[bytes, str]) -> Any:
+    """Parse JSON from bytes or str."""
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def load(path: PathLike) -> Any:
+    """Read and parse a JSON file."""
+    with open(path, "rb") as f:
+        return loads(f.read())
+
+def dump(obj: Any, path: PathLike, indent: bool = False, sort_keys: bool = False):
+    """Write obj to path atomically (temp file + rename)."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(dumps(obj, indent=indent, sort_keys=sort_keys))
+    os.replace(tmp_path, path)
+
+class ObjectWriter:
+    """
+    Stream a top-level JSON object one member at a time, so the whole document
+    never has to be held in memory. The file is replaced atomically on close.
+
+    Usage:
+        with ObjectWriter("albums_metadata.json", indent=True) as writer:
+            for name, album in albums:
+                writer.add(name, album)
+    """
+
+    def __init__(self, path: PathLike, indent: bool = False, sort_keys: bool = False):
+        self.path = path
+        self.indent = indent
+        self.sort_keys = sort_keys
+        self.count = 0
+        self._tmp_path = f"{path}.tmp"
+        self._file = None
+
+    def __enter__(self) -> "ObjectWriter":
+        self._file = open(self._tmp_path, "wb")
+        self._file.write(b"{")
+        return self
+
+    def add(self, key: str, value: Any):
+        """Append one member; matches the layout dumps() gives the whole object."""
+        if self.count:
+            self._file.write(b",")
+        body = dumps(value, indent=self.indent, sort_keys=self.sort_keys)
+        if self.indent:
+            # JSON strings escape newlines, so this only re-indents structure
+            self._file.write(b"\n  " + dumps(key) + b": " + body.replace(b"\n", b"\n  "))
+        else:
+            self._file.write(dumps(key) + b":" + body)
+        self.count += 1
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.indent and self.count:
+            self._file.write(b"\n")
+        self._file.write(b"}")
+        self._file.close()
+        if exc_type is None:
+            os.replace(self._tmp_path, self.path)
+        else:
+            os.remove(self._tmp_path)
+        return False
@@ -0,0 +1,134 @@
+"""
+Justified Photo Layout
+Splits a sequence of photos into rows that fill a container width exactly,
+choosing row breaks so row heights stay as close to a target as possible.
+"""
+
+from typing import Dict, List, Any
+
+from records import Photo
+
+# Rows are never longer than this; also bounds the DP to O(n * MAX_ROW_LENGTH)
+MAX_ROW_LENGTH = 8
+
+def justify_rows(
+    aspects: List[float],
+    container_width: float,
+    row_height: float,
+    gap: float = 0.0,
+    max_row_length: int = MAX_ROW_LENGTH
+) -> List[int]:
+    """
+    Choose row breaks by linear-partition DP over aspect ratios.
+
+    A row of photos i..j-1 justified to container_width has height
+    (container_width - gaps) / sum(aspects[i:j]); its cost is the squared
+    distance from row_height. The last row is left unjustified when it
+    would otherwise be stretched taller than row_height, so it costs nothing.
+
+    Args:
+        aspects: Width / height of each photo, in display order
+        container_width: Reference container width in pixels
+        row_height: Target row height in pixels
+        gap: Horizontal gap between photos in pixels
+        max_row_length: Most photos allowed in one row
+
+    Returns:
+        Number of photos in each row, in order
+    """
+    n = len(aspects)
+    if n == 0:
+        return []
+
+    prefix = [0.0]
+    for aspect in aspects:
+        prefix.append(prefix[-1] + aspect)
+
+    best = [0.0] + [float("inf")] * n
+    start = [0] * (n + 1)
+    for j in range(1, n + 1):
+        for i in range(j - 1, max(-1, j - 1 - max_row_length), -1):
+            height = (container_width - gap * (j - i - 1)) / (prefix[j] - prefix[i])
+            if j == n and height >= row_height:
+                cost = 0.0
+            else:
+                cost = (height - row_height) ** 2
+            if best[i] + cost < best[j]:
+                best[j] = best[i] + cost
+                start[j] = i
+            # Adding more photos only makes the row shorter from here on
+            if height < row_height / 2:
+                break
+
+    counts = []
+    j = n
+    while j > 0:
+        counts.append(j - start[j])
+        j = start[j]
+    counts.reverse()
+    return counts
+
+def layout_cells(
+    aspects: List[float],
+    counts: List[int],
+    container_width: float,
+    row_height: float,
+    gap: float = 0.0
+) -> List[Dict[str, Any]]:
+    """
+    Cell geometry for each photo given row breaks from justify_rows.
+
+    Each cell's width is share * 100% - gaps * gap of whatever container it is
+    rendered in, which reproduces the same rows at any width. share is rounded
+    down so a row never overflows and wraps early.
+
+    Args:
+        aspects: Width / height of each photo, in display order
+        counts: Photos per row
+        container_width: Reference container width in pixels
+        row_height: Target row height (used for an unjustified last row)
+        gap: Horizontal gap between photos in pixels
+
+    Returns:
+        Per photo {"row", "share", "gaps", "w", "h"}; w and h are pixels at container_width
+    """
+    cells = []
+    index = 0
+    for row, count in enumerate(counts):
+        row_aspects = aspects[index:index + count]
+        inner_width = container_width - gap * (count - 1)
+        height = inner_width / sum(row_aspects)
+        if row == len(counts) - 1:
+            height = min(height, row_height)
+        for aspect in row_aspects:
+            share = int(aspect * height / inner_width * 1e6) / 1e6
+            cells.append({
+                "row": row,
+                "share": share,
+                "gaps": round(share * (count - 1), 6),
+                "w": round(aspect * height),
+                "h": round(height)
+            })
+        index += count
+    return cells
+
+def justified_layout(photos: List[Photo], profiles: Dict[str, Dict[str, float]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Lay out photos for each profile and attach per-photo cells.
+
+    Args:
+        photos: Photos in display order; each gets photo.cell[profile]
+        profiles: name -> {"width", "row_height", "gap"}
+
+    Returns:
+        name -> {"width", "row_height", "gap", "rows"} where rows is photos per row
+    """
+    aspects = [p.aspect_ratio for p in photos]
+    layout = {}
+    for name, profile in profiles.items():
+        counts = justify_rows(aspects, profile["width"], profile["row_height"], profile["gap"])
+        cells = layout_cells(aspects, counts, profile["width"], profile["row_height"], profile["gap"])
+        for photo, cell in zip(photos, cells):
+            photo.cell[name] = cell
+        layout[name] = {**profile, "rows": counts}
+    return layout
@@ -0,0 +1,136 @@
+"""
+Photo and Album Records
+Slotted records shared by the scanner, builder and preview server.
+Derived fields (aspect ratio, orientation, capture time) are computed once
+when a record is created rather than wherever they are needed.
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Optional
+
+# Photos narrower than this (width / height) are classed as portrait
+PORTRAIT_THRESHOLD = 0.85
+
+def classify_orientation(width: int, height: int) -> tuple[float, str]:
+    """Calculate aspect ratio and classify orientation."""
+    aspect_ratio = width / height if height > 0 else 1.0
+    orientation = "portrait" if aspect_ratio < PORTRAIT_THRESHOLD else "landscape"
+    return aspect_ratio, orientation
+
+def parse_exif_datetime(value: str) -> Optional[datetime]:
+    """Parse an EXIF "YYYY:MM:DD HH:MM:SS" timestamp (treated as UTC)."""
+    try:
+        return datetime.strptime(value.strip(), "%Y:%m:%d %H:%M:%S").replace(tzinfo=timezone.utc)
+    except (AttributeError, ValueError):
+        return None
+
+@dataclass(slots=True)
+class Photo:
+    """
+    One photo. The scanner fills in source dimensions, EXIF and ordering;
+    the builder fills in display dimensions, rendition URLs and layout cells.
+    """
+    filename: str
+    width: int
+    height: int
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    photo_name: str = ""
+    sort_index: int = 0
+    src: str = ""
+    thumb: str = ""
+    sources: List[Dict[str, Any]] = field(default_factory=list)
+    placeholder: Optional[str] = None
+    color: Optional[str] = None
+    cell: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    aspect_ratio: float = field(init=False)
+    orientation: str = field(init=False)
+    taken: Optional[datetime] = field(init=False)
+
+    def __post_init__(self):
+        self.aspect_ratio, self.orientation = classify_orientation(self.width, self.height)
+        self.taken = parse_exif_datetime(self.metadata.get("date_taken", ""))
+
+    @classmethod
+    def from_scan(cls, entry: Dict[str, Any]) -> "Photo":
+        """Photo from an albums_metadata.json entry."""
+        filename = entry["filename"]
+        return cls(
+            filename=filename,
+            width=entry.get("width", 0),
+            height=entry.get("height", 0),
+            metadata=entry.get("metadata", {}),
+            photo_name=entry.get("photo_name", filename),
+            sort_index=entry.get("sort_index", 0)
+        )
+
+    @classmethod
+    def from_rendition(cls, filename: str, rendition: Dict[str, Any], metadata: Dict[str, Any]) -> "Photo":
+        """Photo from a process_image record; width and height are the display size."""
+        return cls(
+            filename=filename,
+            width=rendition["w"],
+            height=rendition["h"],
+            metadata=metadata,
+            src=rendition["src"],
+            thumb=rendition["thumb"],
+            sources=rendition["sources"],
+            placeholder=rendition.get("placeholder"),
+            color=rendition.get("color")
+        )
+
+    def to_scan(self) -> Dict[str, Any]:
+        """albums_metadata.json entry."""
+        return {
+            "filename": self.filename,
+            "photo_name": self.photo_name,
+            "width": self.width,
+            "height": self.height,
+            "aspect_ratio": round(self.aspect_ratio, 3),
+            "orientation": self.orientation,
+            "metadata": self.metadata,
+            "sort_index": self.sort_index
+        }
+
+    def to_db(self) -> Dict[str, Any]:
+        """Photo entry of an album's db shard."""
+        return {
+            "filename": self.filename,
+            "src": self.src,
+            "w": self.width,
+            "h": self.height,
+            "thumb": self.thumb,
+            "sources": self.sources,
+            "placeholder": self.placeholder,
+            "color": self.color,
+            "meta": self.metadata,
+            "cell": self.cell
+        }
+
+@dataclass(slots=True)
+class Album:
+    """One built album; photos are in display order."""
+    slug: str
+    title: str
+    subtitle: str
+    summary: str
+    cover: Photo
+    updated: Optional[str]
+    layout: Dict[str, Dict[str, Any]]
+    photos: List[Photo]
+
+    def to_db(self) -> Dict[str, Any]:
+        """Album db shard (db/<slug>.json)."""
+        return {
+            "slug": self.slug,
+            "title": self.title,
+            "subtitle": self.subtitle,
+            "summary": self.summary,
+            "cover": self.cover.thumb,
+            "cover_sources": self.cover.sources,
+            "cover_placeholder": self.cover.placeholder,
+            "cover_color": self.cover.color,
+            "updated": self.updated,
+            "layout": self.layout,
+            "photos": [photo.to_db() for photo in self.photos]
+        }
@@ -1,13 +1,20 @@
 import os
 import json
 import re
+import hashlib
+import argparse
 from pathlib import Path
 from datetime import datetime
 from typing import Dict, List, Any
-from PIL import Image, ImageOps, ExifTags
+from PIL import Image, ExifTags
+
+import jsonio
+from records import Photo
 
 ALBUMS_DIR = "Albums"
 OUTPUT_FILE = "albums_metadata.json"
+# Per-file stat fingerprints from the previous scan (machine-local, not committed)
+FINGERPRINT_FILE = os.path.join(".cache", "scan_fingerprints.json")
 
 # EXIF Tag Mapping
 # Using numeric constants or names where available in ExifTags.TAGS
@@ -222,19 +229,18 @@ def load_existing_metadata(filepath: str) -> Dict[str, Any]:
         return {}
     
     try:
-        with open(filepath, 'r') as f:
-            return json.load(f)
-    except (json.JSONDecodeError, IOError) as e:
+        return jsonio.load(filepath)
+    except (jsonio.JSONDecodeError, IOError) as e:
         print(f"Error loading existing metadata: {e}")
         print("Proceeding with fresh scan.")
         return {}
 
 def merge_photo_metadata(
     old_photos: List[Dict],
-    new_scanned_photos: List[Dict],
+    new_scanned_photos: List[Photo],
     changes: ChangeTracker,
     album_name: str
-) -> List[Dict]:
+) -> List[Photo]:
     """
     Merge old and new photo metadata, preserving sort_index and photo_name.
     
@@ -249,7 +255,7 @@ def merge_photo_metadata(
     """
     # Build lookup by filename
     old_by_filename = {p['filename']: p for p in old_photos}
-    new_by_filename = {p['filename']: p for p in new_scanned_photos}
+    new_by_filename = {p.filename: p for p in new_scanned_photos}
     
     # Track filenames
     old_filenames = set(old_by_filename.keys())
@@ -268,32 +274,24 @@ def merge_photo_metadata(
         old_photo = old_by_filename[filename]
         new_photo = new_by_filename[filename]
         
-        # Create merged photo, preserving critical fields
-        merged = {
-            "filename": filename,
-            "photo_name": old_photo.get("photo_name", filename),  # Preserve custom name
-            "width": new_photo["width"],                           # Update from filesystem
-            "height": new_photo["height"],
-            "aspect_ratio": new_photo["aspect_ratio"],
-            "orientation": new_photo["orientation"],
-            "metadata": new_photo["metadata"],                     # Update EXIF
-            "sort_index": old_photo["sort_index"]                  # Preserve order
-        }
+        # Dimensions and EXIF come from the filesystem; name and order are preserved
+        new_photo.photo_name = old_photo.get("photo_name", filename)
+        new_photo.sort_index = old_photo["sort_index"]
         
         # Track if metadata changed
-        if old_photo.get("metadata") != new_photo["metadata"]:
+        if old_photo.get("metadata") != new_photo.metadata:
             changes.log_photo_updated(album_name, filename, {
                 "metadata": {
                     "old": old_photo.get("metadata", {}),
-                    "new": new_photo["metadata"]
+                    "new": new_photo.metadata
                 }
             })
         
-        merged_photos.append(merged)
+        merged_photos.append(new_photo)
     
     # 2. Process new photos (append to end)
     if merged_photos:
-        max_sort_index = max(p["sort_index"] for p in merged_photos)
+        max_sort_index = max(p.sort_index for p in merged_photos)
     else:
         max_sort_index = -1
     
@@ -301,8 +299,8 @@ def merge_photo_metadata(
         new_photo = new_by_filename[filename]
         new_sort_index = max_sort_index + i + 1
         
-        new_photo["photo_name"] = filename  # Default photo_name
-        new_photo["sort_index"] = new_sort_index
+        new_photo.photo_name = filename  # Default photo_name
+        new_photo.sort_index = new_sort_index
         
         merged_photos.append(new_photo)
         changes.log_photo_added(album_name, filename, new_sort_index)
@@ -317,61 +315,111 @@ def merge_photo_metadata(
         )
     
     # Sort by sort_index before returning
-    merged_photos.sort(key=lambda p: p["sort_index"])
+    merged_photos.sort(key=lambda p: p.sort_index)
     
     return merged_photos
 
+def hash_file(path: Path, chunk_size: int = 1 << 20) -> str:
+    """Return the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_fingerprints(filepath: str) -> Dict[str, Dict[str, Any]]:
+    """Load fingerprints from the previous scan, or an empty dict."""
+    try:
+        return jsonio.load(filepath)
+    except (FileNotFoundError, jsonio.JSONDecodeError, IOError):
+        return {}
+
+def save_fingerprints(filepath: str, fingerprints: Dict[str, Dict[str, Any]]):
+    """Write fingerprints for the next scan."""
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    jsonio.dump(fingerprints, filepath)
+
+def fingerprint_file(
+    image_path: Path,
+    previous: Dict[str, Any],
+    use_hash: bool = False
+) -> tuple[Dict[str, Any], bool]:
+    """
+    Fingerprint a file and compare it with the previous scan.
+    
+    Size and mtime_ns decide unless use_hash is set, in which case a stat
+    mismatch falls back to comparing content hashes (useful after a fresh
+    checkout resets every mtime).
+    
+    Args:
+        image_path: File to fingerprint
+        previous: Fingerprint recorded by the previous scan (may be empty)
+        use_hash: Record and compare SHA-256 content hashes
+    
+    Returns:
+        Tuple of (new fingerprint, whether the file is unchanged)
+    """
+    stat = image_path.stat()
+    fingerprint = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    
+    if previous.get("size") == stat.st_size and previous.get("mtime_ns") == stat.st_mtime_ns:
+        if "sha256" in previous:
+            fingerprint["sha256"] = previous["sha256"]
+        elif use_hash:
+            fingerprint["sha256"] = hash_file(image_path)
+        return fingerprint, True
+    
+    if not use_hash:
+        return fingerprint, False
+    
+    fingerprint["sha256"] = hash_file(image_path)
+    unchanged = previous.get("size") == stat.st_size and previous.get("sha256") == fingerprint["sha256"]
+    return fingerprint, unchanged
+
+def probe_image(image_path: Path) -> Photo:
+    """
+    Read EXIF and dimensions for one image from its header.
+    
+    Returns:
+        Photo with filename, dimensions and metadata (aspect ratio and orientation derived)
+    """
+    width, height = get_image_dimensions(image_path)
+    return Photo(image_path.name, width, height, metadata=get_exif_data(image_path))
+
 def get_image_dimensions(image_path: Path) -> tuple[int, int]:
-    """Extract image dimensions with EXIF orientation applied."""
+    """Extract image dimensions with EXIF orientation applied (header only)."""
     try:
         with Image.open(image_path) as img:
-            img = ImageOps.exif_transpose(img)
-            return img.size  # (width, height)
+            width, height = img.size
+            # Orientations 5-8 rotate by 90 degrees and swap the axes
+            if img.getexif().get(ExifTags.Base.Orientation, 1) in (5, 6, 7, 8):
+                return (height, width)
+            return (width, height)
     except Exception as e:
         print(f"Error reading dimensions for {image_path}: {e}")
         return (0, 0)
 
-def classify_orientation(width: int, height: int) -> tuple[float, str]:
-    """Calculate aspect ratio and classify orientation."""
-    aspect_ratio = width / height if height > 0 else 1.0
-    orientation = "portrait" if aspect_ratio < 0.85 else "landscape"
-    return aspect_ratio, orientation
-
-def optimize_photo_order(photos: list) -> list:
-    """Reorder photos to pair portraits for better grid layout."""
-    portraits = []
-    landscapes = []
+def scan_albums(use_hash: bool = False, compact: bool = False):
+    """
+    Enhanced album scanning with incremental updates and change tracking.
     
-    for p in photos:
-        w, h = p.get('width', 1), p.get('height', 1)
-        ratio = w / h if h else 1.0
-        
-        if ratio < 0.85:
-            portraits.append(p)
-        else:
-            landscapes.append(p)
-    
-    ordered = []
-    for i in range(0, len(portraits), 2):
-        if i + 1 < len(portraits):
-            ordered.extend([portraits[i], portraits[i+1]])
-        else:
-            ordered.append(portraits[i])
-    
-    ordered.extend(landscapes)
-    return ordered
-
-def scan_albums():
-    """Enhanced album scanning with incremental updates and change tracking."""
+    Files whose fingerprint matches the previous scan reuse their stored
+    dimensions and metadata; only new or modified files are probed.
+    
+    Args:
+        use_hash: Also record SHA-256 content hashes and use them when stat data differs
+        compact: Write albums_metadata.json without indentation
+    """
     # Load existing metadata
     old_metadata = load_existing_metadata(OUTPUT_FILE)
+    old_fingerprints = load_fingerprints(FINGERPRINT_FILE)
+    fingerprints = {}
+    reused_count = 0
+    probed_count = 0
     
     # Initialize change tracker
     changes = ChangeTracker()
     
-    # Prepare new metadata structure
-    albums_data = {}
-    
     if not os.path.exists(ALBUMS_DIR):
         print(f"Directory {ALBUMS_DIR} not found.")
         return
@@ -379,65 +427,63 @@ def scan_albums():
     root_path = Path(ALBUMS_DIR)
     scanned_album_names = set()
     
-    # Scan albums
-    for album_dir in [d for d in root_path.iterdir() if d.is_dir()]:
-        album_name = album_dir.name
-        
-        # Skip hidden folders
-        if album_name.startswith('.'):
-            continue
-        
-        scanned_album_names.add(album_name)
-        print(f"Scanning album: {album_name}")
-        
-        # Get old album data if exists
-        old_album = old_metadata.get(album_name, {})
-        old_photos = old_album.get("photos", [])
-        
-        # Track new album
-        if album_name not in old_metadata:
-            changes.log_album_added(album_name)
-        
-        # Phase 1: Scan filesystem for new photos
-        new_scanned_photos = []
-        valid_extensions = {'.jpg', '.jpeg', '.png', '.webp'}
-        
-        for file in album_dir.iterdir():
-            if file.suffix.lower() in valid_extensions:
-                # Get EXIF metadata
-                metadata = get_exif_data(file)
-                
-                # Get image dimensions
-                width, height = get_image_dimensions(file)
-                
-                # Calculate aspect ratio and orientation
-                aspect_ratio, orientation = classify_orientation(width, height)
-                
-                new_scanned_photos.append({
-                    "filename": file.name,
-                    "width": width,
-                    "height": height,
-                    "aspect_ratio": round(aspect_ratio, 3),
-                    "orientation": orientation,
-                    "metadata": metadata
-                })
-        
-        # Phase 2: Merge with old metadata (preserves sort_index and photo_name)
-        merged_photos = merge_photo_metadata(
-            old_photos,
-            new_scanned_photos,
-            changes,
-            album_name
-        )
-        
-        # Build album entry
-        albums_data[album_name] = {
-            "album_title": old_album.get("album_title", album_name),
-            "subtitle": old_album.get("subtitle", ""),
-            "summary": old_album.get("summary", ""),
-            "folder_name": album_name,
-            "photos": merged_photos
-        }
+    # Scan albums, streaming each album's entry to the output as it completes
+    with jsonio.ObjectWriter(OUTPUT_FILE, indent=not compact) as writer:
+        for album_dir in [d for d in root_path.iterdir() if d.is_dir()]:
+            album_name = album_dir.name
+
+            # Skip hidden folders
+            if album_name.startswith('.'):
+                continue
+
+            scanned_album_names.add(album_name)
+            print(f"Scanning album: {album_name}")
+
+            # Get old album data if exists
+            old_album = old_metadata.get(album_name, {})
+            old_photos = old_album.get("photos", [])
+
+            # Track new album
+            if album_name not in old_metadata:
+                changes.log_album_added(album_name)
+
+            # Phase 1: Scan filesystem for new photos
+            new_scanned_photos = []
+            valid_extensions = {'.jpg', '.jpeg', '.png', '.webp'}
+
+            old_by_filename = {p['filename']: p for p in old_photos}
+
+            for file in album_dir.iterdir():
+                if file.suffix.lower() in valid_extensions:
+                    key = f"{album_name}/{file.name}"
+                    fingerprint, unchanged = fingerprint_file(file, old_fingerprints.get(key, {}), use_hash)
+                    fingerprints[key] = fingerprint
+
+                    old_photo = old_by_filename.get(file.name)
+                    if unchanged and old_photo and "width" in old_photo and "metadata" in old_photo:
+                        # Unchanged since last scan: reuse stored values without opening the file
+                        new_scanned_photos.append(Photo.from_scan(old_photo))
+                        reused_count += 1
+                    else:
+                        new_scanned_photos.append(probe_image(file))
+                        probed_count += 1
+
+            # Phase 2: Merge with old metadata (preserves sort_index and photo_name)
+            merged_photos = merge_photo_metadata(
+                old_photos,
+                new_scanned_photos,
+                changes,
+                album_name
+            )
+
+            # Write this album's entry before scanning the next one
+            writer.add(album_name, {
+                "album_title": old_album.get("album_title", album_name),
+                "subtitle": old_album.get("subtitle", ""),
+                "summary": old_album.get("summary", ""),
+                "folder_name": album_name,
+                "photos": [photo.to_scan() for photo in merged_photos]
+            })
     
     # Track removed albums
     old_album_names = set(old_metadata.keys())
@@ -445,14 +491,35 @@ def scan_albums():
     for album in removed_albums:
         changes.log_album_removed(album)
 
-    # Write output
-    with open(OUTPUT_FILE, 'w') as f:
-        json.dump(albums_data, f, indent=2)
+    save_fingerprints(FINGERPRINT_FILE, fingerprints)
     
-    print(f"Metadata generated in {OUTPUT_FILE}")
+    print(f"Metadata generated in {OUTPUT_FILE} ({probed_count} probed, {reused_count} unchanged)")
     
     # Save change log
     changes.save_to_file()
 
+def parse_args(argv=None) -> argparse.Namespace:
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Scan Albums/ and update albums_metadata.json.")
+    parser.add_argument(
+        "--hash",
+        action="store_true",
+        help="Record content hashes so files with changed mtimes but identical bytes are not re-probed"
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Ignore stored fingerprints and probe every file"
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Write albums_metadata.json without indentation (smaller and faster for large libraries)"
+    )
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
-    scan_albums()
+    args = parse_args()
+    if args.full and os.path.exists(FINGERPRINT_FILE):
+        os.remove(FINGERPRINT_FILE)
+    scan_albums(use_hash=args.hash, compact=args.compact)
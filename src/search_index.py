@@ -0,0 +1,108 @@
+"""
+Portfolio Search Index
+Cross-album inverted indexes over photo EXIF, so the client can filter the
+whole portfolio by camera, lens and date without fetching per-album data.
+Every index is split into small files that are only downloaded when needed.
+"""
+
+import hashlib
+from typing import Dict, List, Any
+
+from records import Album, Photo
+
+# Output directory, relative to the site root
+SEARCH_DIR = "search"
+# Photos per photo-table shard
+PHOTO_SHARD_SIZE = 500
+# (date, photo id) pairs per date shard
+DATE_SHARD_SIZE = 2000
+
+# index.json key -> (EXIF fields, first present wins)
+FACETS = {
+    "cameras": ("camera_model", "Model"),
+    "lenses": ("lens_model",),
+}
+
+def facet_value(photo: Photo, fields: tuple) -> str:
+    """First non-empty EXIF field of a photo, or "" if it has none."""
+    for name in fields:
+        value = photo.metadata.get(name)
+        if value:
+            return str(value)
+    return ""
+
+def posting_file(facet: str, value: str) -> str:
+    """Shard name for one facet value (names are hashed, since values are free text)."""
+    digest = hashlib.sha1(value.encode("utf-8")).hexdigest()[:12]
+    return f"{facet}/{digest}.json"
+
+def photo_entry(album: Album, photo: Photo) -> Dict[str, Any]:
+    """What a search result needs to be shown and linked to its album."""
+    return {
+        "album": album.slug,
+        "filename": photo.filename,
+        "src": photo.src,
+        "thumb": photo.thumb,
+        "w": photo.width,
+        "h": photo.height,
+        "color": photo.color
+    }
+
+def build_search_index(albums: List[Album]) -> Dict[str, Any]:
+    """
+    Build the search index documents.
+
+    Photo ids number every photo in album and display order. Each camera and
+    lens gets its own sorted id list, capture dates are one array sorted by
+    date and split into shards with their date bounds, and the photo table is
+    split into fixed-size shards so id // shard_size locates any photo.
+
+    Args:
+        albums: Albums in site order
+
+    Returns:
+        Path relative to SEARCH_DIR -> JSON document; "index.json" lists every
+        other file, which it names relative to itself
+    """
+    photos = []
+    postings = {facet: {} for facet in FACETS}
+    dated = []
+    for album in albums:
+        for photo in album.photos:
+            photo_id = len(photos)
+            photos.append(photo_entry(album, photo))
+            for facet, fields in FACETS.items():
+                value = facet_value(photo, fields)
+                if value:
+                    postings[facet].setdefault(value, []).append(photo_id)
+            if photo.taken:
+                dated.append((photo.taken.strftime("%Y-%m-%dT%H:%M:%S"), photo_id))
+    dated.sort()
+
+    docs = {}
+    index = {
+        "photos": {"count": len(photos), "shard_size": PHOTO_SHARD_SIZE, "shards": []},
+        "dates": {"count": len(dated), "shards": []}
+    }
+
+    for start in range(0, len(photos), PHOTO_SHARD_SIZE):
+        name = f"photos/{start // PHOTO_SHARD_SIZE}.json"
+        docs[name] = photos[start:start + PHOTO_SHARD_SIZE]
+        index["photos"]["shards"].append(name)
+
+    for facet, values in postings.items():
+        index[facet] = []
+        for value in sorted(values):
+            name = posting_file(facet, value)
+            # Ids are appended in increasing order, so each list is already sorted
+            docs[name] = values[value]
+            index[facet].append({"name": value, "count": len(values[value]), "file": name})
+
+    for start in range(0, len(dated), DATE_SHARD_SIZE):
+        name = f"dates/{start // DATE_SHARD_SIZE}.json"
+        shard = dated[start:start + DATE_SHARD_SIZE]
+        docs[name] = [list(entry) for entry in shard]
+        index["dates"]["shards"].append({"from": shard[0][0], "to": shard[-1][0], "file": name})
+
+    docs["index.json"] = index
+    return docs
@@ -0,0 +1,459 @@
+#!/usr/bin/env python3
+"""
+Portfolio Preview Server
+Serves the site straight from Albums/, src/templates and src/static without a
+full build. Pages are rendered on request and renditions are generated the
+first time they are requested, then kept in a size-bounded LRU disk cache.
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import mimetypes
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Tuple
+from urllib.parse import quote, unquote, urlsplit
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from PIL import Image, ImageOps
+from jinja2 import TemplateNotFound
+
+import build
+import jsonio
+from scan_albums import get_image_dimensions
+from search_index import SEARCH_DIR, build_search_index
+
+PREVIEW_CACHE_DIR = build.CACHE_DIR / "preview"
+METADATA_FILE = Path("albums_metadata.json")
+DEFAULT_CACHE_MB = 512
+POLL_INTERVAL = 0.5
+
+RENDITIONS = {
+    # kind: (bounding box, JPEG quality)
+    "large": (build.LARGE_SIZE, build.LARGE_QUALITY),
+    "thumb": (build.THUMB_SIZE, build.THUMB_QUALITY),
+}
+
+def fit_within(width: int, height: int, box: Tuple[int, int]) -> Tuple[int, int]:
+    """Size of a width x height image after Image.thumbnail(box)."""
+    if width <= 0 or height <= 0:
+        return box
+    scale = min(box[0] / width, box[1] / height, 1.0)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def generate_rendition(img_path: Path, kind: str) -> bytes:
+    """Encode one rendition of an image, using the same pipeline as process_image."""
+    size, quality = RENDITIONS[kind]
+    image_format = Image.registered_extensions().get(img_path.suffix.lower(), "JPEG")
+    with Image.open(img_path) as img:
+        build.configure_draft(img, size)
+        ImageOps.exif_transpose(img, in_place=True)
+        img.thumbnail(size)
+        buffer = io.BytesIO()
+        img.save(buffer, format=image_format, quality=quality)
+        return buffer.getvalue()
+
+class RenditionLRU:
+    """Size-bounded on-disk rendition cache that evicts the least recently used files."""
+
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.entries = OrderedDict()  # name -> size, oldest first
+        self._lock = threading.Lock()
+        self._pending = {}  # name -> lock, so concurrent requests encode once
+
+        directory.mkdir(parents=True, exist_ok=True)
+        existing = sorted(directory.iterdir(), key=lambda p: p.stat().st_mtime)
+        for path in existing:
+            if path.is_file():
+                self.entries[path.name] = path.stat().st_size
+                self.total_bytes += self.entries[path.name]
+        self._evict()
+
+    def get_or_create(self, name: str, create) -> Path:
+        """
+        Return the cached file for name, calling create() to produce its bytes on a miss.
+
+        Args:
+            name: Cache file name
+            create: Callable returning the file content
+        """
+        with self._lock:
+            if name in self.entries:
+                self.entries.move_to_end(name)
+                return self.directory / name
+            pending = self._pending.setdefault(name, threading.Lock())
+
+        with pending:
+            with self._lock:
+                if name in self.entries:
+                    self.entries.move_to_end(name)
+                    return self.directory / name
+
+            data = create()
+            path = self.directory / name
+            tmp_path = path.with_suffix(path.suffix + ".tmp")
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+            with self._lock:
+                self.entries[name] = len(data)
+                self.total_bytes += len(data)
+                self._pending.pop(name, None)
+                self._evict(keep=name)
+            return path
+
+    def _evict(self, keep: Optional[str] = None):
+        """Drop least recently used files until the cache fits max_bytes."""
+        while self.total_bytes > self.max_bytes and self.entries:
+            name, size = next(iter(self.entries.items()))
+            if name == keep:
+                break
+            del self.entries[name]
+            self.total_bytes -= size
+            try:
+                (self.directory / name).unlink()
+            except FileNotFoundError:
+                pass
+
+class PreviewSite:
+    """In-memory album model and rendered-page cache, invalidated by file changes."""
+
+    def __init__(self, renditions: RenditionLRU):
+        self.renditions = renditions
+        self._lock = threading.RLock()
+        self._dimensions = {}  # (path, mtime_ns) -> (width, height)
+        self.pages = {}  # URL path -> (content type, body)
+        self.reload_templates()
+        self.reload_all()
+
+    # Model
+
+    def reload_templates(self):
+        with self._lock:
+            self.env = build.create_environment()
+            self.pages.clear()
+
+    def reload_all(self):
+        """Rebuild every album from disk."""
+        with self._lock:
+            self.albums_metadata = build.load_albums_metadata(METADATA_FILE)
+            self.albums = {}
+            self.folders = {}
+            self.sources = {}
+            for album_path, slug, images in build.list_albums():
+                self._load_album(album_path, slug, images)
+            self._refresh_index()
+            self.pages.clear()
+
+    def reload_album(self, folder_name: str):
+        """Rebuild one album; other albums' pages are kept unless the shared index changed."""
+        with self._lock:
+            slug = build.album_slug_for(folder_name)
+            album_path = build.ALBUMS_DIR / folder_name
+            old_index = self.album_index
+
+            self.albums.pop(slug, None)
+            self.sources = {k: v for k, v in self.sources.items() if k[0] != slug}
+            if album_path.is_dir():
+                images = [p for p in sorted(album_path.iterdir()) if p.suffix in build.VALID_EXTENSIONS]
+                self._load_album(album_path, slug, images)
+            self._refresh_index()
+
+            if self.album_index != old_index:
+                self.pages.clear()
+            else:
+                # The search index numbers photos across albums, so any album change touches it
+                stale = [
+                    p for p in self.pages
+                    if p.startswith((f"/{slug}/", f"/{SEARCH_DIR}/")) or p == f"/db/{slug}.json"
+                ]
+                for path in stale:
+                    del self.pages[path]
+
+    def _load_album(self, album_path: Path, slug: str, images: List[Path]):
+        album_meta = self.albums_metadata.get(album_path.name, {})
+        scanned = {p.get("filename"): p for p in album_meta.get("photos", [])}
+        records = [self._photo_record(img_path, slug, scanned.get(img_path.name)) for img_path in images]
+        album = build.assemble_album(album_path, slug, images, records, album_meta)
+        if album:
+            self.albums[slug] = album
+            self.folders[slug] = album_path.name
+            for img_path in images:
+                self.sources[(slug, img_path.name)] = img_path
+
+    def _photo_record(self, img_path: Path, slug: str, scanned: Optional[dict]) -> Optional[Dict[str, Any]]:
+        """Photo record pointing at lazily generated renditions."""
+        try:
+            stat = img_path.stat()
+        except OSError:
+            return None
+
+        if scanned and scanned.get("width") and scanned.get("height"):
+            dimensions = (scanned["width"], scanned["height"])
+        else:
+            cache_key = (img_path, stat.st_mtime_ns)
+            if cache_key not in self._dimensions:
+                self._dimensions[cache_key] = get_image_dimensions(img_path)
+            dimensions = self._dimensions[cache_key]
+
+        width, height = fit_within(*dimensions, build.LARGE_SIZE)
+        # The version parameter changes whenever the source does, so renditions can be cached hard
+        name = quote(img_path.name)
+        version = f"?v={stat.st_mtime_ns}"
+        return {
+            "src": f"/media/{slug}/large/{name}{version}",
+            "w": width,
+            "h": height,
+            "thumb": f"/media/{slug}/thumb/{name}{version}",
+            "sources": []
+        }
+
+    def _refresh_index(self):
+        ordered = [self.albums[slug] for slug in sorted(self.albums, key=lambda s: self.folders[s])]
+        self.album_list = ordered
+        self.album_index = [build.album_index_entry(album) for album in ordered]
+        self.navigation = build.build_album_navigation(ordered)
+        self.search_docs = None  # Built on first request
+
+    # Rendering
+
+    def page(self, path: str) -> Optional[Tuple[str, bytes]]:
+        """Rendered page for a URL path, or None if there is no such page."""
+        with self._lock:
+            if path in self.pages:
+                return self.pages[path]
+            rendered = self._render(path)
+            if rendered is not None:
+                self.pages[path] = rendered
+            return rendered
+
+    def not_found(self) -> bytes:
+        with self._lock:
+            try:
+                return self._render_template("404.html", albums=self.album_index)
+            except TemplateNotFound:
+                return b"Not Found"
+
+    def _render_template(self, name: str, **context) -> bytes:
+        return self.env.get_template(name).render(base_url="", **context).encode("utf-8")
+
+    def _render(self, path: str) -> Optional[Tuple[str, bytes]]:
+        html = "text/html; charset=utf-8"
+        data = "application/json"
+        if path == "/":
+            return html, self._render_template("index.html", albums=self.album_index, current_album=None)
+        if path == "/about/":
+            return html, self._render_template("about.html", albums=self.album_index)
+        if path == "/db.json":
+            return data, jsonio.dumps({"albums": self.album_index}, sort_keys=True)
+
+        if path.startswith(f"/{SEARCH_DIR}/"):
+            if self.search_docs is None:
+                self.search_docs = build_search_index(self.album_list)
+            doc = self.search_docs.get(path[len(SEARCH_DIR) + 2:])
+            return (data, jsonio.dumps(doc, sort_keys=True)) if doc is not None else None
+
+        parts = path.strip("/").split("/")
+        if len(parts) == 2 and parts[0] == "db" and parts[1].endswith(".json"):
+            album = self.albums.get(parts[1][:-len(".json")])
+            return (data, jsonio.dumps(album.to_db(), sort_keys=True)) if album else None
+
+        album = self.albums.get(parts[0])
+        if album is None:
+            return None
+        if path == f"/{parts[0]}/":
+            return html, self._render_template(
+                "index.html",
+                albums=self.album_index,
+                current_album=album,
+                navigation=self.navigation[parts[0]]
+            )
+        if path == f"/{parts[0]}/metadata.json":
+            body = build.render_album_metadata(album, self.navigation[parts[0]], None)
+            return data, body.encode("utf-8")
+        return None
+
+    def rendition(self, slug: str, kind: str, filename: str) -> Optional[Path]:
+        """Path to a (possibly freshly generated) rendition, or None if unknown."""
+        if kind not in RENDITIONS:
+            return None
+        with self._lock:
+            img_path = self.sources.get((slug, filename))
+        if img_path is None or not img_path.exists():
+            return None
+
+        stat = img_path.stat()
+        settings = json.dumps(build.rendition_settings(), sort_keys=True)
+        key = f"{img_path}:{stat.st_size}:{stat.st_mtime_ns}:{kind}:{settings}"
+        name = hashlib.sha256(key.encode("utf-8")).hexdigest()[:32] + img_path.suffix.lower()
+        return self.renditions.get_or_create(name, lambda: generate_rendition(img_path, kind))
+
+    # Invalidation
+
+    def apply_changes(self, changed: List[Path]):
+        """Invalidate only what the changed files affect."""
+        template_dir = build.TEMPLATE_DIR.resolve()
+        albums_dir = build.ALBUMS_DIR.resolve()
+        reload_all = False
+        folders = set()
+
+        for path in changed:
+            resolved = path.resolve()
+            if resolved == METADATA_FILE.resolve():
+                reload_all = True
+            elif template_dir in resolved.parents:
+                print(f"Template changed: {path}")
+                self.reload_templates()
+            elif albums_dir in resolved.parents:
+                relative = resolved.relative_to(albums_dir)
+                if len(relative.parts) == 1:
+                    # An album folder itself was added or removed
+                    reload_all = True
+                else:
+                    folders.add(relative.parts[0])
+            # Static files are served from disk and need no invalidation
+
+        if reload_all:
+            print("Album list or metadata changed, reloading all albums")
+            self.reload_all()
+            return
+        for folder in sorted(folders):
+            print(f"Album changed: {folder}")
+            self.reload_album(folder)
+
+def snapshot(paths: List[Path]) -> Dict[Path, int]:
+    """mtime_ns of every file and directory under the given paths."""
+    state = {}
+    for root in paths:
+        if root.is_file():
+            state[root] = root.stat().st_mtime_ns
+            continue
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+            for name in dirnames + filenames:
+                path = Path(dirpath) / name
+                try:
+                    state[path] = path.stat().st_mtime_ns
+                except FileNotFoundError:
+                    pass
+    return state
+
+def watch(site: PreviewSite, interval: float = POLL_INTERVAL):
+    """Poll watched paths and hand changed files to the site (runs in a daemon thread)."""
+    paths = [build.ALBUMS_DIR, build.TEMPLATE_DIR, build.STATIC_DIR, METADATA_FILE]
+    previous = snapshot([p for p in paths if p.exists()])
+    while True:
+        time.sleep(interval)
+        current = snapshot([p for p in paths if p.exists()])
+        changed = [p for p in current.keys() | previous.keys() if current.get(p) != previous.get(p)]
+        previous = current
+        if changed:
+            try:
+                site.apply_changes(changed)
+            except Exception as e:
+                print(f"Error applying changes: {e}")
+
+def make_handler(site: PreviewSite):
+    """Request handler class bound to a PreviewSite."""
+
+    class PreviewHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = unquote(urlsplit(self.path).path)
+            try:
+                if path.startswith("/static/"):
+                    self._send_file(build.STATIC_DIR, path[len("/static/"):], "no-cache")
+                elif path.startswith("/media/"):
+                    parts = path[len("/media/"):].split("/", 2)
+                    rendition = site.rendition(*parts) if len(parts) == 3 else None
+                    if rendition is None:
+                        self._send_not_found()
+                    else:
+                        self._send_path(rendition, "public, max-age=31536000, immutable")
+                else:
+                    if not path.endswith("/") and "." not in path.rsplit("/", 1)[-1]:
+                        self.send_response(301)
+                        self.send_header("Location", path + "/")
+                        self.end_headers()
+                        return
+                    page = site.page(path)
+                    if page is None:
+                        self._send_not_found()
+                    else:
+                        self._send(200, page[0], page[1], "no-cache")
+            except Exception as e:
+                print(f"Error serving {path}: {e}")
+                self._send(500, "text/plain; charset=utf-8", str(e).encode("utf-8"), "no-store")
+
+        def _send(self, status: int, content_type: str, body: bytes, cache_control: str):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Cache-Control", cache_control)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_path(self, path: Path, cache_control: str):
+            content_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+            self._send(200, content_type, path.read_bytes(), cache_control)
+
+        def _send_file(self, root: Path, relative: str, cache_control: str):
+            path = (root / relative).resolve()
+            if root.resolve() not in path.parents or not path.is_file():
+                self._send_not_found()
+            else:
+                self._send_path(path, cache_control)
+
+        def _send_not_found(self):
+            self._send(404, "text/html; charset=utf-8", site.not_found(), "no-cache")
+
+        def log_message(self, format, *args):
+            sys.stderr.write(f"{self.address_string()} - {format % args}\n")
+
+    return PreviewHandler
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Preview the portfolio site without a full build.")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to bind (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on (default: 8000)")
+    parser.add_argument(
+        "--cache-mb",
+        type=int,
+        default=DEFAULT_CACHE_MB,
+        help=f"Maximum size of the preview rendition cache in MB (default: {DEFAULT_CACHE_MB})"
+    )
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Preview server entry point."""
+    args = parse_args(argv)
+    if not build.ALBUMS_DIR.exists():
+        print(f"Error: {build.ALBUMS_DIR} not found.")
+        return 1
+
+    renditions = RenditionLRU(PREVIEW_CACHE_DIR, args.cache_mb * 1024 * 1024)
+    site = PreviewSite(renditions)
+    threading.Thread(target=watch, args=(site,), daemon=True).start()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(site))
+    print(f"Previewing {len(site.albums)} albums at http://{args.host}:{args.port}/ (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopping preview server.")
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
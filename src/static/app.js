@@ -5,6 +5,178 @@
 import PhotoSwipeLightbox from 'https://unpkg.com/photoswipe@5.4.2/dist/photoswipe-lightbox.esm.js';
 import PhotoSwipe from 'https://unpkg.com/photoswipe@5.4.2/dist/photoswipe.esm.js';
 
+// Filter results shown at once; the count still covers every match
+const MAX_FILTER_RESULTS = 200;
+
+// Intersection of ascending photo id lists
+function intersectIds(lists) {
+    return lists.reduce((result, list) => {
+        const matches = [];
+        let i = 0;
+        let j = 0;
+        while (i < result.length && j < list.length) {
+            if (result[i] === list[j]) {
+                matches.push(result[i]);
+                i++;
+                j++;
+            } else if (result[i] < list[j]) {
+                i++;
+            } else {
+                j++;
+            }
+        }
+        return matches;
+    });
+}
+
+/**
+ * Portfolio-wide camera/lens/date filter over the build's search index.
+ * index.json lists the cameras, lenses and date shards; a camera's or lens's
+ * id list, the date shards in range and the photo shards holding the first
+ * results are only fetched once a filter needs them.
+ */
+function initPhotoFilter(form) {
+    const indexUrl = new URL(form.dataset.index, window.location.href);
+    const baseUrl = form.dataset.baseUrl;
+    const status = document.getElementById('filter-status');
+    const results = document.getElementById('filter-results');
+    const albumGrid = document.querySelector('.album-grid');
+    const shards = new Map();
+    let generation = 0;
+
+    // Each file is fetched at most once; a failed fetch is retried next time
+    const load = file => {
+        const url = new URL(file, indexUrl).href;
+        if (!shards.has(url)) {
+            shards.set(url, fetch(url).then(response => {
+                if (!response.ok) {
+                    throw new Error(`${url}: HTTP ${response.status}`);
+                }
+                return response.json();
+            }).catch(error => {
+                shards.delete(url);
+                throw error;
+            }));
+        }
+        return shards.get(url);
+    };
+
+    const addOptions = (select, entries) => {
+        for (const entry of entries) {
+            const option = document.createElement('option');
+            option.value = entry.file;
+            option.textContent = `${entry.name} (${entry.count})`;
+            select.append(option);
+        }
+    };
+
+    // Ids of photos taken between from and to (YYYY-MM-DD, either may be empty)
+    const idsInDateRange = async (dates, from, to) => {
+        const until = to ? `${to}T23:59:59` : '';
+        const inRange = date => (!from || date >= from) && (!until || date <= until);
+        const overlapping = dates.shards.filter(shard => (!from || shard.to >= from) && (!until || shard.from <= until));
+        const ids = [];
+        for (const entries of await Promise.all(overlapping.map(shard => load(shard.file)))) {
+            for (const [date, id] of entries) {
+                if (inRange(date)) {
+                    ids.push(id);
+                }
+            }
+        }
+        return ids.sort((a, b) => a - b);
+    };
+
+    const showAlbums = () => {
+        status.hidden = true;
+        results.hidden = true;
+        results.replaceChildren();
+        if (albumGrid) {
+            albumGrid.hidden = false;
+        }
+    };
+
+    const showPhotos = async (index, ids) => {
+        const { shard_size: shardSize, shards: photoShards } = index.photos;
+        const shown = ids.slice(0, MAX_FILTER_RESULTS);
+        const needed = [...new Set(shown.map(id => Math.floor(id / shardSize)))];
+        const loaded = new Map(await Promise.all(needed.map(async n => [n, await load(photoShards[n])])));
+
+        return shown.map(id => {
+            const photo = loaded.get(Math.floor(id / shardSize))[id % shardSize];
+            const link = document.createElement('a');
+            link.href = `${baseUrl}/${photo.album}/`;
+            link.className = 'filter-result';
+            const img = document.createElement('img');
+            img.src = `${baseUrl}${photo.thumb}`;
+            img.width = photo.w;
+            img.height = photo.h;
+            img.alt = '';
+            img.loading = 'lazy';
+            if (photo.color) {
+                img.style.backgroundColor = photo.color;
+            }
+            link.append(img);
+            return link;
+        });
+    };
+
+    const applyFilter = async index => {
+        const current = ++generation;
+        const { camera, lens, from, to } = Object.fromEntries(new FormData(form));
+        if (!camera && !lens && !from && !to) {
+            showAlbums();
+            return;
+        }
+
+        const lists = await Promise.all([
+            camera ? load(camera) : null,
+            lens ? load(lens) : null,
+            from || to ? idsInDateRange(index.dates, from, to) : null
+        ].filter(list => list !== null));
+        const ids = intersectIds(lists);
+        const links = await showPhotos(index, ids);
+        if (current !== generation) {
+            return; // A newer filter has started
+        }
+
+        const noun = ids.length === 1 ? 'photo' : 'photos';
+        status.textContent = ids.length > links.length
+            ? `${ids.length} ${noun}, showing the first ${links.length}`
+            : `${ids.length} ${noun}`;
+        status.hidden = false;
+        results.replaceChildren(...links);
+        results.hidden = false;
+        if (albumGrid) {
+            albumGrid.hidden = true;
+        }
+    };
+
+    // On failure, fall back to the album grid and say why
+    const runFilter = index => {
+        const filtered = applyFilter(index);
+        const current = generation; // applyFilter claims its generation before awaiting
+        filtered.catch(error => {
+            if (current !== generation) {
+                return;
+            }
+            showAlbums();
+            status.textContent = `Could not filter photos: ${error.message}`;
+            status.hidden = false;
+        });
+    };
+
+    load('index.json').then(index => {
+        addOptions(form.elements.camera, index.cameras);
+        addOptions(form.elements.lens, index.lenses);
+        form.hidden = false;
+        form.addEventListener('change', () => runFilter(index));
+        // Reset clears the fields after this event, so filter once it has
+        form.addEventListener('reset', () => setTimeout(() => runFilter(index)));
+    }).catch(error => {
+        console.warn('Photo filter unavailable:', error);
+    });
+}
+
 document.addEventListener('DOMContentLoaded', () => {
     // Mobile Menu Toggle
     const menuToggle = document.getElementById('menu-toggle');
@@ -27,6 +199,12 @@ document.addEventListener('DOMContentLoaded', () => {
         lightbox.init();
     }
 
+    // Portfolio filter (home page)
+    const photoFilter = document.getElementById('photo-filter');
+    if (photoFilter) {
+        initPhotoFilter(photoFilter);
+    }
+
     // Asset Protection: Prevent Right-Click and Dragging
     document.addEventListener('contextmenu', event => {
         event.preventDefault();
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The build scripts are flat modules in src/, run as `python src/<script>.py`
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
@@ -0,0 +1,79 @@
+from PIL import Image
+
+import build
+
+
+def test_reduce_factor_landscape_photo():
+    assert build.reduce_factor((4000, 3000), build.LARGE_SIZE) == 1
+    assert build.reduce_factor((8000, 6000), build.LARGE_SIZE) == 2
+
+
+def test_reduce_factor_follows_fit_for_wide_images():
+    # The box is matched to the long side, and the long side's fit sets the factor
+    assert build.reduce_factor((30000, 4000), build.LARGE_SIZE) == 9
+    assert build.reduce_factor((20000, 5000), build.LARGE_SIZE) == 6
+
+
+def test_reduce_factor_tall_image_is_conservative():
+    # A tall source is fitted to 1200x1600 rather than the landscape 1600x1200
+    # box the thumbnail uses, so it reduces by 24000 / 1600 / 2 (7), not 24000 / 1200 / 2 (10)
+    assert build.reduce_factor((3000, 24000), build.LARGE_SIZE) == 7
+    assert build.reduce_factor((4000, 30000), build.LARGE_SIZE) == 9
+
+
+def test_reduce_factor_never_below_one():
+    assert build.reduce_factor((800, 600), build.LARGE_SIZE) == 1
+    assert build.reduce_factor((1, 1), build.LARGE_SIZE) == 1
+
+
+def test_estimate_image_memory_panorama(tmp_path):
+    path = tmp_path / "panorama.png"
+    Image.new("L", (12000, 1000)).save(path)
+
+    decoded = 12000 * 1000
+    large = build.LARGE_SIZE[0] * build.LARGE_SIZE[1] * 4
+    # Fit is 1600 / 12000, so the reduced copy is 1/3 per side, not a second full copy
+    expected = path.stat().st_size + decoded + decoded // 9 + large
+    assert build.estimate_image_memory(path) == expected
+
+
+def test_estimate_image_memory_unreadable(tmp_path):
+    path = tmp_path / "broken.jpg"
+    path.write_bytes(b"not an image")
+    assert build.estimate_image_memory(path) == 0
+
+
+def test_live_outputs_leave_build_report_to_caller():
+    # A report from an earlier --profile build must not survive a plain build
+    assert build.live_outputs([], ["index.html"]) == {"index.html", "db.json"}
+
+
+def test_prune_rendition_cache_keeps_live_entries(tmp_path, monkeypatch):
+    monkeypatch.setattr(build, "RENDITION_CACHE_DIR", tmp_path / "renditions")
+    live, stale, stale_shard = "ab" + "1" * 62, "ab" + "2" * 62, "cd" + "3" * 62
+    for key in (live, stale, stale_shard):
+        build.store_cached_rendition(key, {"files": []}, [("thumb.jpg", b"x")])
+
+    assert build.prune_rendition_cache({live}) == 2
+    assert build.load_cached_rendition(live) is not None
+    assert not (tmp_path / "renditions" / "ab" / stale).exists()
+    # Emptied shard directories go too
+    assert not (tmp_path / "renditions" / "cd").exists()
+
+
+def test_prune_rendition_cache_without_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(build, "RENDITION_CACHE_DIR", tmp_path / "missing")
+    assert build.prune_rendition_cache(set()) == 0
+
+
+def test_hash_sources_keeps_order(tmp_path):
+    paths = []
+    for n in range(5):
+        path = tmp_path / f"{n}.jpg"
+        path.write_bytes(bytes([n]) * 100)
+        paths.append(path)
+    paths.insert(2, tmp_path / "missing.jpg")
+
+    keys = build.hash_sources(paths, jobs=3)
+    assert keys == [build.source_key(path) for path in paths]
+    assert keys[2] is None and None not in keys[:2] + keys[3:]